@@ -1,11 +1,139 @@
+from datetime import timedelta
+
 from django.contrib import admin
-from . import models
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from . import facade, models
+from .paginators import EstimatedCountPaginator
+from .routers import replica_reads, with_related
+from .search import search_transactions
+
+ADMIN_CHUNK_SIZE = 1000
+# Keyset paging: only show transactions with a primary key below this
+BEFORE_VAR = 'before'
+
+
+def chunked_update(queryset, chunk_size=ADMIN_CHUNK_SIZE, on_chunk=None,
+                   **values):
+    """
+    Update ``queryset`` in primary key ordered chunks so no single statement
+    holds locks on a large part of the table.
+
+    Each chunk's rows are locked and checked against ``queryset`` again
+    before the update, so rows changed in the meantime are left alone.
+    ``on_chunk`` is called with the primary keys actually updated, in the
+    same database transaction.
+    """
+    queryset = queryset.prefetch_related(None)
+    last_pk, updated = 0, 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                   .values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return updated
+        db = router.db_for_write(queryset.model)
+        with transaction.atomic(using=db):
+            locked = list(
+                queryset.using(db).select_for_update().filter(pk__in=pks)
+                .order_by('pk').values_list('pk', flat=True))
+            updated += queryset.model._default_manager.using(db).filter(
+                pk__in=locked).update(**values)
+            if on_chunk is not None and locked:
+                on_chunk(locked)
+        last_pk = pks[-1]
+
+
+def record_failed_events(pks):
+    OutboxEvent = models.RazorpayOutboxEvent
+    txns = list(models.RazorpayTransaction.objects.filter(pk__in=pks))
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent.for_transaction(txn, OutboxEvent.FAILED)
+        for txn in txns])
+    if txns:
+        facade.invalidate_status(
+            [txn.txnid for txn in txns], using=txns[0]._state.db)
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Accept ``?before=<pk>`` so deep pages are read from the primary key
+    index instead of skipping rows with ``OFFSET``.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super(KeysetChangeList, self).get_filters_params(
+            params)
+        self.before = lookup_params.pop(BEFORE_VAR, None)
+        return lookup_params
+
+    def get_queryset(self, request):
+        queryset = super(KeysetChangeList, self).get_queryset(request)
+        if self.before is None:
+            return queryset
+        try:
+            return queryset.filter(pk__lt=int(self.before))
+        except ValueError:
+            raise IncorrectLookupParameters(
+                "Invalid %s value %r" % (BEFORE_VAR, self.before))
+
+
+class StatusListFilter(admin.SimpleListFilter):
+    """
+    Filter on the known statuses rather than ``SELECT DISTINCT status``.
+    """
+    title = _('status')
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        Transaction = models.RazorpayTransaction
+        return [(status, status) for status in (
+            Transaction.INITIATED, Transaction.ISSUED,
+            Transaction.AUTHORIZED, Transaction.CAPTURED,
+            Transaction.CAPTURE_FAILED, Transaction.AUTH_FAILED)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(status=self.value())
+        return queryset
+
+
+class CreatedListFilter(admin.SimpleListFilter):
+    """
+    Recent transactions by creation date, a range scan on its index.
+    """
+    title = _('created')
+    parameter_name = 'created_within'
+    periods = (1, 7, 30, 90)
+
+    def lookups(self, request, model_admin):
+        return [('%d' % days, _("Past %d days") % days)
+                for days in self.periods]
+
+    def queryset(self, request, queryset):
+        if self.value() in ['%d' % days for days in self.periods]:
+            return queryset.filter(date_created__gte=(
+                timezone.now() - timedelta(days=int(self.value()))))
+        return queryset
 
 
 class RazorpayTransactionAdmin(admin.ModelAdmin):
     list_display = ['user', 'amount', 'currency', 'txnid', 'status',
                     'rz_id', 'error_code', 'error_message', 'date_created',
-                    'basket_id', 'email']
+                    'basket_number', 'order_number', 'email']
+    # Users may live on another database, see get_queryset
+    list_select_related = ()
+    list_filter = [StatusListFilter, CreatedListFilter]
+    # Only used to show the search box, see get_search_results
+    search_fields = ['=txnid', '=rz_id', '=frozen_basket', '=order', 'email']
+    # Newest first on the primary key index, or (status, id) when filtered
+    ordering = ['-pk']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['mark_auth_failed']
     readonly_fields = [
         'user',
         'amount',
@@ -16,7 +144,53 @@ class RazorpayTransactionAdmin(admin.ModelAdmin):
         'error_message',
         'date_created',
         'basket_id',
+        'frozen_basket',
+        'order',
         'email'
     ]
 
+    def get_queryset(self, request):
+        return with_related(
+            super(RazorpayTransactionAdmin, self).get_queryset(request),
+            'user')
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def changelist_view(self, request, extra_context=None):
+        # Listings can be served from the replica, actions can't
+        if request.method != 'GET':
+            return super(RazorpayTransactionAdmin, self).changelist_view(
+                request, extra_context)
+        with replica_reads():
+            response = super(RazorpayTransactionAdmin, self).changelist_view(
+                request, extra_context)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+    # Show the columns themselves so listing doesn't join Oscar's tables
+
+    def basket_number(self, obj):
+        return obj.frozen_basket_id
+    basket_number.short_description = _("Basket")
+
+    def order_number(self, obj):
+        return obj.order_id
+    order_number.short_description = _("Order number")
+
+    def get_search_results(self, request, queryset, search_term):
+        return search_transactions(queryset, search_term), False
+
+    def mark_auth_failed(self, request, queryset):
+        Transaction = models.RazorpayTransaction
+        updated = chunked_update(
+            queryset.filter(status=Transaction.INITIATED),
+            on_chunk=record_failed_events, status=Transaction.AUTH_FAILED)
+        self.message_user(
+            request, _("%d abandoned transactions marked as failed")
+            % updated)
+    mark_auth_failed.short_description = _(
+        "Mark abandoned transactions as failed")
+
 admin.site.register(models.RazorpayTransaction, RazorpayTransactionAdmin)
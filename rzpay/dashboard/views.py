@@ -1,15 +1,57 @@
 from django.views import generic
 
-from .. import models
+from .. import facade, models
+from ..paginators import EstimatedCountPaginator
+from ..routers import replica_reads, with_related
+from ..search import search_transactions
 
 
-class TransactionListView(generic.ListView):
+class ReplicaReadsMixin(object):
+    """
+    Serve the view's reads from the payments replica, if there is one.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads():
+            response = super(ReplicaReadsMixin, self).dispatch(
+                request, *args, **kwargs)
+            # Evaluate lazy querysets while we're still on the replica
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+
+class TransactionListView(ReplicaReadsMixin, generic.ListView):
     model = models.RazorpayTransaction
     template_name = 'rzpay/dashboard/transaction_list.html'
     context_object_name = 'transactions'
+    paginate_by = 20
+    paginator_class = EstimatedCountPaginator
+
+    def get_queryset(self):
+        self.query = self.request.GET.get('q', '')
+        return search_transactions(with_related(
+            super(TransactionListView, self).get_queryset(), 'user'),
+            self.query)
 
+    def get_context_data(self, **kwargs):
+        ctx = super(TransactionListView, self).get_context_data(**kwargs)
+        ctx['query'] = self.query
+        return ctx
 
-class TransactionDetailView(generic.DetailView):
+
+class TransactionDetailView(ReplicaReadsMixin, generic.DetailView):
     model = models.RazorpayTransaction
     template_name = 'rzpay/dashboard/transaction_detail.html'
     context_object_name = 'txn'
+
+    def get_queryset(self):
+        # Called per request, as the database depends on replica_reads
+        return with_related(
+            super(TransactionDetailView, self).get_queryset(),
+            'user', 'frozen_basket', 'order')
+
+    def get_context_data(self, **kwargs):
+        ctx = super(TransactionDetailView, self).get_context_data(**kwargs)
+        ctx['gateway'] = facade.get_payment_details(self.object)
+        return ctx
@@ -2,15 +2,30 @@
 Responsible for briding between Oscar and the Razorpay gateway
 """
 from __future__ import unicode_literals
+from decimal import Decimal
+from multiprocessing.pool import ThreadPool
 from uuid import uuid4
+import hashlib
+import hmac
 import logging
+import threading
+import time
 
 from django.conf import settings
+from django.core.cache import caches
+from django.db import (
+    IntegrityError, connections, router, transaction as db_transaction)
+from django.utils.encoding import force_bytes
 
-from .models import RazorpayTransaction as Transaction
+from .models import (
+    RazorpayOutboxEvent as OutboxEvent, RazorpayTransaction as Transaction)
 from .exceptions import RazorpayError
+from .health import monitor
+from .scheduler import (  # noqa
+    scheduler, is_rate_limit_error, RateLimitExceeded, INTERACTIVE, BATCH)
 
 import razorpay
+from razorpay.errors import BadRequestError
 
 rz_client = razorpay.Client(
     auth=(settings.RAZORPAY_API_KEY, settings.RAZORPAY_API_SECRET)
@@ -19,6 +34,67 @@ rz_client = razorpay.Client(
 logger = logging.getLogger('razorpay')
 
 
+def _gateway_call(priority, func, *args, **kwargs):
+    """
+    Call the Razorpay API within the rate limit shared by all workers.
+
+    Checkout requests use the ``INTERACTIVE`` priority; bulk jobs should pass
+    ``BATCH`` so they never delay a customer.
+
+    Fails fast with ``RazorpayError`` while the circuit for the operation is
+    open, see ``rzpay.health``. Only the HTTP call itself is timed, so
+    waiting for a token doesn't count as gateway latency.
+    """
+    operation = func.__name__
+    if monitor.is_open(operation, priority):
+        logger.warning(
+            "Razorpay %s circuit for %s is open", priority, operation)
+        raise RazorpayError("Razorpay is currently unavailable")
+
+    def timed(*args, **kwargs):
+        start = time.time()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            # Rejected requests and 429s say nothing about the gateway's
+            # health
+            if not (is_rate_limit_error(e) or
+                    isinstance(e, BadRequestError)):
+                monitor.record(
+                    operation, False, time.time() - start, priority)
+            raise
+        monitor.record(operation, True, time.time() - start, priority)
+        return result
+
+    kwargs.setdefault('timeout', getattr(settings, 'RAZORPAY_TIMEOUT', 10))
+    return scheduler.call(priority, timed, *args, **kwargs)
+
+
+def is_gateway_healthy():
+    """
+    Whether Razorpay payments should be offered to customers right now.
+    """
+    return monitor.is_healthy()
+
+
+def _record_event(txn, event_type, **data):
+    """
+    Add a lifecycle event for ``txn`` to the outbox. Call this inside the
+    database transaction that makes the change.
+    """
+    OutboxEvent.for_transaction(txn, event_type, **data).save()
+
+
+def _save_transaction(txn, event_type):
+    """
+    Save a status change together with its outbox event.
+    """
+    with db_transaction.atomic(using=router.db_for_write(Transaction)):
+        txn.save()
+        _record_event(txn, event_type)
+    _publish_status(txn)
+
+
 def start_razorpay_txn(basket, amount, user=None, email=None):
     """
     Record the start of a transaction and calculate costs etc.
@@ -29,19 +105,20 @@ def start_razorpay_txn(basket, amount, user=None, email=None):
         currency = getattr(settings, 'RAZORPAY_CURRENCY', 'INR')
     transaction = Transaction(
         user=user, amount=amount, currency=currency, status="initiated",
-        basket_id=basket.id, txnid=uuid4().hex[:28], email=email
+        basket_id=basket.id, frozen_basket_id=basket.id,
+        txnid=uuid4().hex[:28], email=email
     )
-    transaction.save()
+    _save_transaction(transaction, OutboxEvent.INITIATED)
     return transaction
 
 
-def update_transaction_details(rz_id, txn_id):
+def update_transaction_details(rz_id, txn_id, priority=INTERACTIVE):
     """
     Fetch the completed details about the Razorpay transaction and update our
     tranaction model.
     """
     try:
-        payment = rz_client.payment.fetch(rz_id)
+        payment = _gateway_call(priority, rz_client.payment.fetch, rz_id)
     except Exception as e:
         logger.warning(
             "Unable to fetch transaction details for rz txn %s: %s",
@@ -63,19 +140,22 @@ def update_transaction_details(rz_id, txn_id):
         raise RazorpayError
     txn.status = payment["status"]
     txn.rz_id = rz_id
-    txn.save()
+    txn.error_code = payment.get("error_code")
+    txn.error_message = (payment.get("error_description") or "")[:256] or None
+    _save_transaction(txn, txn.status)
     return txn
 
 
-def capture_transaction(rz_id):
+def capture_transaction(rz_id, priority=INTERACTIVE):
     """
     capture the payment
     """
     try:
         txn = Transaction.objects.get(rz_id=rz_id)
-        rz_client.payment.capture(rz_id, int(txn.amount*100))
+        _gateway_call(priority, rz_client.payment.capture, rz_id,
+                      int(txn.amount*100))
         txn.status = "captured"
-        txn.save()
+        _save_transaction(txn, OutboxEvent.CAPTURED)
     except Exception as e:
         logger.warning(
             "Couldn't capture payment for txn %s: %s",
@@ -85,14 +165,321 @@ def capture_transaction(rz_id):
     return txn
 
 
-def refund_transaction(rz_id, amount, currency):
+def record_order(txn, order_number):
+    """
+    Link a transaction to the order it paid for.
+    """
+    txn.order_id = order_number
+    txn.save(update_fields=['order'])
+
+
+def refund_transaction(rz_id, amount, currency, priority=BATCH):
     try:
-        txn = Transaction.objects.get(rz_id)
+        txn = Transaction.objects.get(rz_id=rz_id)
         assert amount <= int(txn.amount*100)
         assert currency == txn.currency
-        rz_client.payment.refund(rz_id, amount)
+        _gateway_call(priority, rz_client.payment.refund, rz_id, amount)
+        _record_event(txn, OutboxEvent.REFUNDED, refund_amount=amount)
     except Exception as e:
         logger.warning(
             "Couldn't refund txn %s: %s",
             txn, e
         )
+
+
+def payment_link_txnid(order):
+    """
+    The txnid of the payment link transaction for an order, which makes
+    creating links idempotent.
+
+    Signed with ``SECRET_KEY`` so that nobody can work out the txnid, and
+    poll the transaction's status, from an order number.
+    """
+    key = force_bytes("payment-link:%s" % order.number)
+    return hmac.new(
+        force_bytes(settings.SECRET_KEY), key, hashlib.sha256
+    ).hexdigest()[:28]
+
+
+def _invoice_data(txn, order):
+    return {
+        "type": "link",
+        "amount": int(txn.amount*100),
+        "currency": txn.currency,
+        "receipt": order.number,
+        "description": "Payment for order %s" % order.number,
+        "customer": {"email": txn.email},
+        "email_notify": 1,
+        "sms_notify": 0,
+        "notes": {"txn_id": txn.txnid},
+    }
+
+
+def _issue_payment_link(pk, order, priority, db):
+    """
+    Send the payment link for one transaction and record it in the same
+    database transaction.
+
+    The row stays locked while the gateway call is made, so a concurrent run
+    waits and then finds the link already issued instead of emailing the
+    customer a second one. To keep the lock short it waits at most
+    ``RAZORPAY_LINK_WAIT`` seconds for a slot; links that don't get one are
+    left for the next run.
+    """
+    try:
+        with db_transaction.atomic(using=db):
+            txn = Transaction.objects.using(db).select_for_update().filter(
+                pk=pk, invoice_id__isnull=True).first()
+            if txn is None:
+                return
+            invoice = _gateway_call(
+                priority, rz_client.invoice.create, _invoice_data(txn, order),
+                acquire_timeout=getattr(settings, 'RAZORPAY_LINK_WAIT', 5))
+            txn.invoice_id = invoice["id"]
+            txn.short_url = invoice.get("short_url")
+            txn.status = Transaction.ISSUED
+            txn.save(using=db,
+                     update_fields=['invoice_id', 'short_url', 'status'])
+            _record_event(txn, OutboxEvent.ISSUED)
+            _publish_status(txn)
+    except Exception as e:
+        logger.warning(
+            "Couldn't create payment link for txn %s: %s", pk, e)
+    finally:
+        # Pool threads have their own connections
+        connections.close_all()
+
+
+def _create_link_transactions(txns, db):
+    """
+    Save new payment link transactions with their outbox events, skipping
+    any a concurrent run has just created.
+    """
+    try:
+        with db_transaction.atomic(using=db):
+            Transaction.objects.using(db).bulk_create(txns)
+            # Not every database returns primary keys from bulk_create
+            created = Transaction.objects.using(db).filter(
+                txnid__in=[txn.txnid for txn in txns])
+            OutboxEvent.objects.using(db).bulk_create([
+                OutboxEvent.for_transaction(txn, OutboxEvent.INITIATED)
+                for txn in created])
+    except IntegrityError:
+        for txn in txns:
+            try:
+                with db_transaction.atomic(using=db):
+                    txn.save(using=db)
+                    _record_event(txn, OutboxEvent.INITIATED)
+            except IntegrityError:
+                pass
+
+
+def create_payment_links(orders, concurrency=None, priority=BATCH):
+    """
+    Create a Razorpay payment link for each order and return the link
+    transactions.
+
+    Safe to re-run with the same orders, or to run concurrently: link
+    transactions are keyed by the unique ``payment_link_txnid`` and each is
+    locked while its link is sent. Every link is recorded as soon as the
+    gateway returns it. Orders should have their ``user`` selected already.
+    """
+    if concurrency is None:
+        concurrency = getattr(settings, 'RAZORPAY_LINK_CONCURRENCY', 8)
+    db = router.db_for_write(Transaction)
+    txnids = dict((payment_link_txnid(order), order) for order in orders)
+    existing = set(Transaction.objects.using(db).filter(
+        txnid__in=list(txnids)).values_list('txnid', flat=True))
+    new = [
+        Transaction(
+            user_id=order.user_id, email=order.email,
+            amount=order.total_incl_tax, currency=order.currency,
+            status=Transaction.INITIATED, basket_id=order.basket_id,
+            frozen_basket_id=order.basket_id, order_id=order.number,
+            txnid=txnid)
+        for txnid, order in txnids.items() if txnid not in existing]
+    if new:
+        _create_link_transactions(new, db)
+
+    pending = list(Transaction.objects.using(db).filter(
+        txnid__in=list(txnids), invoice_id__isnull=True
+    ).values_list('pk', 'txnid'))
+    pool = ThreadPool(max(1, min(concurrency, len(pending) or 1)))
+    try:
+        for _ in pool.imap_unordered(
+                lambda row: _issue_payment_link(
+                    row[0], txnids[row[1]], priority, db),
+                pending):
+            pass
+    finally:
+        pool.close()
+    return list(Transaction.objects.using(db).filter(
+        txnid__in=list(txnids)))
+
+
+STATUS_FIELDS = ('txnid', 'status', 'error_code', 'error_message')
+
+
+def _status_key(txnid):
+    return "rzpay:status:%s" % txnid
+
+
+def _publish_status(txn):
+    """
+    Update the cached status of a transaction once its change is committed.
+    """
+    state = dict((field, getattr(txn, field)) for field in STATUS_FIELDS)
+    db_transaction.on_commit(
+        lambda: _cache().set(
+            _status_key(txn.txnid), state,
+            getattr(settings, 'RAZORPAY_STATUS_CACHE_TTL', 3600)),
+        using=txn._state.db)
+
+
+def invalidate_status(txnids, using=None):
+    """
+    Drop the cached status of transactions changed outside the facade once
+    the change is committed.
+    """
+    keys = [_status_key(txnid) for txnid in txnids]
+    db_transaction.on_commit(lambda: _cache().delete_many(keys), using=using)
+
+
+def status_cache_is_shared():
+    """
+    Whether status changes published by one process reach the others, which
+    long-polling ``PaymentStatusView`` depends on.
+    """
+    from django.core.cache.backends.dummy import DummyCache
+    from django.core.cache.backends.locmem import LocMemCache
+    return not isinstance(_cache(), (DummyCache, LocMemCache))
+
+
+def get_transaction_status(txnid):
+    """
+    Return the status fields of a transaction, or None if there isn't one.
+
+    Status changes made through the facade are pushed to the cache, so this
+    only queries the database (by the txnid index) on a cache miss. A cache
+    that isn't shared by every process would miss changes made elsewhere,
+    so then the database is always queried.
+    """
+    shared = status_cache_is_shared()
+    state = _cache().get(_status_key(txnid)) if shared else None
+    if state is None:
+        state = Transaction.objects.filter(txnid=txnid).values(
+            *STATUS_FIELDS).first()
+        if state is None:
+            return None
+        if shared:
+            # Don't overwrite a newer status published while we were reading
+            _cache().add(_status_key(txnid), state,
+                         getattr(settings, 'RAZORPAY_STATUS_CACHE_TTL', 3600))
+    return state
+
+
+def _paise(value):
+    if value is None:
+        return None
+    return Decimal(value) / 100
+
+
+def _refresh_payment_details(rz_id, priority, acquire_timeout=None):
+    """
+    Fetch the gateway's view of a payment, cache it and write any error
+    details back to our transaction.
+    """
+    try:
+        payment = _gateway_call(priority, rz_client.payment.fetch, rz_id,
+                                acquire_timeout=acquire_timeout)
+        refunds = _gateway_call(
+            priority, rz_client.payment.get_url,
+            "%s/%s/refunds" % (rz_client.payment.base_url, rz_id), {},
+            acquire_timeout=acquire_timeout)
+    except Exception as e:
+        logger.warning(
+            "Unable to fetch gateway details for rz txn %s: %s", rz_id, e)
+        raise RazorpayError
+    details = {
+        "status": payment.get("status"),
+        "method": payment.get("method"),
+        "bank": payment.get("bank") or payment.get("wallet") or
+        payment.get("vpa"),
+        "fee": _paise(payment.get("fee")),
+        "tax": _paise(payment.get("tax")),
+        "amount_refunded": _paise(payment.get("amount_refunded")),
+        "refund_status": payment.get("refund_status"),
+        "error_code": payment.get("error_code"),
+        "error_message": payment.get("error_description"),
+        "refunds": [
+            {"id": refund["id"], "amount": _paise(refund.get("amount")),
+             "created_at": refund.get("created_at")}
+            for refund in refunds.get("items", [])],
+    }
+    if details["error_code"]:
+        Transaction.objects.filter(rz_id=rz_id).update(
+            error_code=details["error_code"],
+            error_message=(details["error_message"] or "")[:256] or None)
+        invalidate_status(Transaction.objects.filter(
+            rz_id=rz_id).values_list('txnid', flat=True))
+
+    ttl = getattr(settings, 'RAZORPAY_DETAILS_CACHE_TTL', 300)
+    stale_ttl = getattr(settings, 'RAZORPAY_DETAILS_STALE_TTL', 3600)
+    _cache().set(_details_key(rz_id),
+                 {"fetched_at": time.time(), "details": details},
+                 ttl + stale_ttl)
+    return details
+
+
+def _cache():
+    return caches[getattr(settings, 'RAZORPAY_CACHE', 'default')]
+
+
+def _details_key(rz_id):
+    return "rzpay:payment-details:%s" % rz_id
+
+
+def _refresh_in_background(rz_id):
+    # Only one worker refreshes a given payment at a time
+    if not _cache().add(_details_key(rz_id) + ":refreshing", True, 60):
+        return
+
+    def refresh():
+        try:
+            _refresh_payment_details(rz_id, BATCH)
+        except RazorpayError:
+            pass
+        finally:
+            _cache().delete(_details_key(rz_id) + ":refreshing")
+            connections.close_all()
+
+    thread = threading.Thread(target=refresh)
+    thread.daemon = True
+    thread.start()
+
+
+def get_payment_details(txn):
+    """
+    Return the gateway's details for a transaction, or None if they can't be
+    fetched.
+
+    Cached details are served for ``RAZORPAY_DETAILS_CACHE_TTL`` seconds and
+    after that are still served stale for ``RAZORPAY_DETAILS_STALE_TTL``
+    seconds while they're refreshed in the background.
+
+    Staff lookups run at ``BATCH`` priority so they never delay a checkout,
+    waiting at most ``RAZORPAY_DETAILS_WAIT`` seconds for a slot.
+    """
+    if not txn.rz_id:
+        return None
+    cached = _cache().get(_details_key(txn.rz_id))
+    if cached is not None:
+        age = time.time() - cached["fetched_at"]
+        if age > getattr(settings, 'RAZORPAY_DETAILS_CACHE_TTL', 300):
+            _refresh_in_background(txn.rz_id)
+        return cached["details"]
+    try:
+        return _refresh_payment_details(
+            txn.rz_id, BATCH, getattr(settings, 'RAZORPAY_DETAILS_WAIT', 5))
+    except RazorpayError:
+        return None
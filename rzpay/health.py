@@ -0,0 +1,129 @@
+"""
+Sliding-window health tracking for calls to the Razorpay gateway.
+
+Call counts, errors and latency are kept per operation and priority in
+short buckets in the Django cache, so every worker process sees the same
+picture. When an operation's error rate or average latency over the window
+crosses its threshold, the circuit opens for a cool-down period: the facade
+then fails fast instead of waiting on the gateway. ``is_healthy`` tells the
+checkout to stop offering Razorpay while the interactive circuit is open for
+any operation the checkout needs, listed in
+``RAZORPAY_HEALTH_CHECKOUT_OPERATIONS``. Slow batch calls, such as the
+dashboard refreshing payments, only trip their own circuit.
+"""
+from __future__ import unicode_literals
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .scheduler import INTERACTIVE
+
+logger = logging.getLogger('razorpay')
+
+
+class GatewayHealthMonitor(object):
+    key_prefix = 'rzpay:health'
+    bucket_size = 10
+
+    def __init__(self, window=None, min_calls=None, error_rate=None,
+                 latency=None, cooldown=None, checkout_operations=None,
+                 cache_alias=None):
+        self.window = window or getattr(
+            settings, 'RAZORPAY_HEALTH_WINDOW', 60)
+        self.min_calls = min_calls or getattr(
+            settings, 'RAZORPAY_HEALTH_MIN_CALLS', 10)
+        self.error_rate = error_rate or getattr(
+            settings, 'RAZORPAY_HEALTH_ERROR_RATE', 0.5)
+        self.latency = latency or getattr(
+            settings, 'RAZORPAY_HEALTH_LATENCY', 5.0)
+        self.cooldown = cooldown or getattr(
+            settings, 'RAZORPAY_HEALTH_COOLDOWN', 30)
+        self.checkout_operations = checkout_operations or getattr(
+            settings, 'RAZORPAY_HEALTH_CHECKOUT_OPERATIONS',
+            ('fetch', 'capture'))
+        self.cache_alias = cache_alias or getattr(
+            settings, 'RAZORPAY_CACHE', 'default')
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _key(self, *parts):
+        return ':'.join((self.key_prefix,) + tuple('%s' % p for p in parts))
+
+    def _buckets(self):
+        current = int(time.time()) // self.bucket_size
+        return range(current - self.window // self.bucket_size + 1,
+                     current + 1)
+
+    def _incr(self, key, delta):
+        self.cache.add(key, 0, self.window + self.bucket_size)
+        try:
+            self.cache.incr(key, delta)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.add(key, delta, self.window + self.bucket_size)
+
+    def stats(self, operation, priority=INTERACTIVE):
+        """
+        Return (calls, errors, total latency in ms) over the window.
+        """
+        keys = [self._key(operation, priority, bucket, field)
+                for bucket in self._buckets()
+                for field in ('calls', 'errors', 'latency')]
+        values = self.cache.get_many(keys)
+        totals = {'calls': 0, 'errors': 0, 'latency': 0}
+        for key, value in values.items():
+            totals[key.rsplit(':', 1)[1]] += value
+        return totals['calls'], totals['errors'], totals['latency']
+
+    def record(self, operation, success, duration, priority=INTERACTIVE):
+        """
+        Record the outcome of a gateway call that took ``duration`` seconds.
+        """
+        bucket = int(time.time()) // self.bucket_size
+        self._incr(self._key(operation, priority, bucket, 'calls'), 1)
+        self._incr(self._key(operation, priority, bucket, 'latency'),
+                   int(duration * 1000))
+        if not success:
+            self._incr(self._key(operation, priority, bucket, 'errors'), 1)
+
+        calls, errors, latency = self.stats(operation, priority)
+        if calls < self.min_calls:
+            return
+        if (float(errors) / calls >= self.error_rate or
+                latency / 1000.0 / calls >= self.latency):
+            self.trip(operation, priority, calls, errors, latency)
+
+    def trip(self, operation, priority, calls, errors, latency):
+        logger.warning(
+            "Opening %s Razorpay circuit for %s for %ss: %d errors in %d "
+            "calls, %dms average latency", priority, operation, self.cooldown,
+            errors, calls, latency // calls)
+        self.cache.set(
+            self._key(operation, priority, 'open'), True, self.cooldown)
+        # Start afresh once the cool-down is over
+        self.cache.delete_many([
+            self._key(operation, priority, bucket, field)
+            for bucket in self._buckets()
+            for field in ('calls', 'errors', 'latency')])
+
+    def is_open(self, operation, priority=INTERACTIVE):
+        return bool(self.cache.get(self._key(operation, priority, 'open')))
+
+    def is_healthy(self):
+        """
+        Whether every operation a checkout needs is currently usable.
+
+        Only interactive calls count: batch jobs, and batch-only operations
+        such as creating payment links, can trip without taking Razorpay off
+        the checkout.
+        """
+        keys = [self._key(operation, INTERACTIVE, 'open')
+                for operation in self.checkout_operations]
+        return not any(self.cache.get_many(keys).values())
+
+
+monitor = GatewayHealthMonitor()
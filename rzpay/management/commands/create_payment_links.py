@@ -0,0 +1,55 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from oscar.core.loading import get_model
+
+from rzpay import facade
+
+Order = get_model('order', 'Order')
+
+
+class Command(BaseCommand):
+    help = (
+        "Create Razorpay payment links for a batch of orders. Safe to re-run: "
+        "orders that already have a link are skipped")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'numbers', nargs='*', help="Order numbers to create links for")
+        parser.add_argument(
+            '--status', help="Create links for all orders with this status")
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help="Orders processed (and persisted) per batch")
+        parser.add_argument(
+            '--concurrency', type=int,
+            help="Concurrent gateway requests (default: "
+            "RAZORPAY_LINK_CONCURRENCY)")
+
+    def handle(self, numbers, **options):
+        if not numbers and not options['status']:
+            raise CommandError("Give order numbers or --status")
+        orders = Order.objects.select_related('user').order_by('pk')
+        if numbers:
+            orders = orders.filter(number__in=numbers)
+        if options['status']:
+            orders = orders.filter(status=options['status'])
+
+        last_pk, issued, failed = 0, 0, 0
+        while True:
+            chunk = list(orders.filter(pk__gt=last_pk)[:options['chunk_size']])
+            if not chunk:
+                break
+            txns = facade.create_payment_links(
+                chunk, concurrency=options['concurrency'])
+            for txn in txns:
+                if txn.invoice_id:
+                    issued += 1
+                else:
+                    failed += 1
+            last_pk = chunk[-1].pk
+            self.stdout.write("%d links issued, %d failed" % (issued, failed))
+        if failed:
+            raise CommandError(
+                "%d links couldn't be created; re-run to retry them" % failed)
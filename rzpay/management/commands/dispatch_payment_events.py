@@ -0,0 +1,58 @@
+from __future__ import unicode_literals
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from rzpay.models import RazorpayOutboxEvent
+from rzpay.outbox import dispatch_events, get_sinks
+
+logger = logging.getLogger('razorpay')
+
+
+class Command(BaseCommand):
+    help = "Deliver pending Razorpay payment events to the configured sinks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help="Events delivered per batch")
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep polling for new events instead of exiting")
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help="Seconds to sleep when there's nothing to deliver")
+        parser.add_argument(
+            '--retry-dead', action='store_true',
+            help="Queue abandoned events for delivery again first")
+
+    def handle(self, **options):
+        if options['retry_dead']:
+            revived = RazorpayOutboxEvent.objects.filter(
+                date_dispatched__isnull=True, date_abandoned__isnull=False
+            ).update(date_abandoned=None, next_attempt=None, attempts=0)
+            self.stdout.write("Requeued %d abandoned events" % revived)
+        sinks = get_sinks()
+        total = 0
+        delay = options['interval']
+        while True:
+            try:
+                dispatched = dispatch_events(options['batch_size'], sinks)
+            except Exception:
+                # Most likely the database; back off rather than spin
+                if not options['loop']:
+                    raise
+                logger.exception("Payment event dispatch failed, retrying "
+                                 "in %ss", delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+            delay = options['interval']
+            total += dispatched
+            if dispatched:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write("Dispatched %d payment events" % total)
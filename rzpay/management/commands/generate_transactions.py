@@ -0,0 +1,218 @@
+from __future__ import unicode_literals
+import csv
+import random
+import string
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, router
+from django.db.models import Max
+from django.utils import six, timezone
+
+from oscar.core.loading import get_model
+
+from rzpay.models import RazorpayTransaction
+
+Basket = get_model('basket', 'Basket')
+
+RZ_ID_CHARS = string.ascii_letters + string.digits
+DOMAINS = ('example.com', 'example.org', 'example.net', 'mail.example.in')
+
+
+def parse_mix(value):
+    """
+    Parse "captured:70,failed:30" into ([choices], [cumulative weights]).
+    """
+    choices, weights, total = [], [], 0
+    try:
+        for part in value.split(','):
+            choice, weight = part.split(':')
+            total += int(weight)
+            choices.append(choice.strip())
+            weights.append(total)
+    except ValueError:
+        raise CommandError("Invalid mix %r" % value)
+    return choices, weights
+
+
+def pick(rng, mix):
+    choices, weights = mix
+    roll = rng.randint(1, weights[-1])
+    for choice, weight in zip(choices, weights):
+        if roll <= weight:
+            return choice
+
+
+@contextmanager
+def explicit_date_created(*models):
+    """
+    Let bulk_create store our date_created values instead of now().
+    """
+    fields = [model._meta.get_field('date_created') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate realistic Razorpay transactions, with users and frozen "
+        "baskets, for scale testing")
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--users', type=int,
+            help="Size of the customer pool (default: count / 10)")
+        parser.add_argument(
+            '--guest-share', type=int, default=20,
+            help="Percentage of guest checkouts")
+        parser.add_argument(
+            '--status-mix',
+            default='captured:70,authorized:5,initiated:10,failed:15')
+        parser.add_argument('--currency-mix', default='INR:95,USD:5')
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help="Spread transactions over this many days before --end")
+        parser.add_argument(
+            '--end', help="Last day to generate for, as YYYY-MM-DD "
+            "(default: today)")
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument(
+            '--copy', action='store_true',
+            help="Load transactions with COPY (PostgreSQL only)")
+
+    def handle(self, count, **options):
+        self.rng = random.Random(options['seed'])
+        self.statuses = parse_mix(options['status_mix'])
+        self.currencies = parse_mix(options['currency_mix'])
+        self.guest_share = options['guest_share']
+        self.days = options['days']
+        if options['end']:
+            end = datetime.strptime(options['end'], '%Y-%m-%d')
+        else:
+            end = datetime.now().replace(hour=0, minute=0, second=0,
+                                         microsecond=0)
+        self.end = timezone.make_aware(end + timedelta(days=1), timezone.utc)
+
+        db = router.db_for_write(RazorpayTransaction)
+        self.connection = connections[db]
+        if options['copy'] and self.connection.vendor != 'postgresql':
+            raise CommandError("--copy needs PostgreSQL")
+
+        try:
+            self.generate(count, options)
+        finally:
+            # Also after a failure, as earlier chunks are already committed
+            self.reset_sequences(get_user_model(), Basket)
+
+    def generate(self, count, options):
+        users = self.create_users(options['users'] or max(1, count // 10),
+                                  options['chunk_size'])
+        chunk_size = options['chunk_size']
+        with explicit_date_created(RazorpayTransaction, Basket):
+            for offset in range(0, count, chunk_size):
+                size = min(chunk_size, count - offset)
+                txns = self.build_chunk(users, size)
+                if options['copy']:
+                    self.copy_transactions(txns)
+                else:
+                    RazorpayTransaction.objects.bulk_create(txns)
+                self.stdout.write("%d/%d" % (offset + size, count))
+
+    def next_id(self, model):
+        return (model._default_manager.aggregate(m=Max('pk'))['m'] or 0) + 1
+
+    def create_users(self, count, chunk_size):
+        User = get_user_model()
+        password = make_password(None)
+        first_id = self.next_id(User)
+        users = []
+        for offset in range(0, count, chunk_size):
+            chunk = []
+            for i in range(offset, min(offset + chunk_size, count)):
+                pk = first_id + i
+                chunk.append(User(
+                    pk=pk, username='loadtest-%d' % pk, password=password,
+                    email='customer%d@%s' % (pk, self.rng.choice(DOMAINS))))
+            User.objects.bulk_create(chunk)
+            users.extend((user.pk, user.email) for user in chunk)
+        return users
+
+    def random_date(self):
+        seconds = self.rng.randint(0, self.days * 86400 - 1)
+        return self.end - timedelta(seconds=seconds + 1)
+
+    def build_chunk(self, users, size):
+        first_basket_id = self.next_id(Basket)
+        baskets, txns = [], []
+        for i in range(size):
+            date_created = self.random_date()
+            if self.rng.randint(1, 100) <= self.guest_share:
+                user_id = None
+                email = 'guest%d@%s' % (self.rng.getrandbits(32),
+                                        self.rng.choice(DOMAINS))
+            else:
+                user_id, email = self.rng.choice(users)
+            basket = Basket(id=first_basket_id + i, owner_id=user_id,
+                            status=Basket.FROZEN, date_created=date_created)
+            baskets.append(basket)
+
+            status = pick(self.rng, self.statuses)
+            rz_id = None
+            if status != RazorpayTransaction.INITIATED:
+                rz_id = 'pay_' + ''.join(
+                    self.rng.choice(RZ_ID_CHARS) for _ in range(14))
+            error_code = error_message = None
+            if status == 'failed':
+                error_code = 'BAD_REQUEST_ERROR'
+                error_message = 'Payment failed'
+            txns.append(RazorpayTransaction(
+                date_created=date_created, user_id=user_id, email=email,
+                txnid='%028x' % self.rng.getrandbits(112),
+                basket_id='%d' % basket.id, frozen_basket_id=basket.id,
+                amount=Decimal(self.rng.randint(100, 5000000)) / 100,
+                currency=pick(self.rng, self.currencies), status=status,
+                rz_id=rz_id, error_code=error_code,
+                error_message=error_message))
+        Basket.objects.bulk_create(baskets)
+        return txns
+
+    def copy_transactions(self, txns):
+        columns = ['date_created', 'user_id', 'email', 'txnid', 'basket_id',
+                   'frozen_basket_id', 'amount', 'currency', 'status',
+                   'rz_id', 'error_code', 'error_message']
+        buf = six.StringIO()
+        writer = csv.writer(buf)
+        for txn in txns:
+            writer.writerow([
+                '' if getattr(txn, column) is None else getattr(txn, column)
+                for column in columns])
+        buf.seek(0)
+        with self.connection.cursor() as cursor:
+            cursor.copy_expert(
+                "COPY %s (%s) FROM STDIN WITH CSV" % (
+                    RazorpayTransaction._meta.db_table, ', '.join(columns)),
+                buf)
+
+    def reset_sequences(self, *models):
+        # We inserted explicit primary keys
+        for model in models:
+            db = router.db_for_write(model)
+            connection = connections[db]
+            statements = connection.ops.sequence_reset_sql(
+                no_style(), [model])
+            if statements:
+                with connection.cursor() as cursor:
+                    for sql in statements:
+                        cursor.execute(sql)
@@ -0,0 +1,136 @@
+from __future__ import unicode_literals
+import csv
+import io
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import six, timezone
+
+from rzpay.models import RazorpaySettlement, RazorpayTransaction
+
+DATE_FORMATS = ('%d/%m/%Y %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%d/%m/%Y')
+
+
+def parse_amount(value):
+    try:
+        return Decimal(value or 0)
+    except InvalidOperation:
+        raise CommandError("Invalid amount %r" % value)
+
+
+def parse_datetime(value):
+    if not value:
+        return None
+    if value.isdigit():
+        return datetime.fromtimestamp(int(value), timezone.utc)
+    for fmt in DATE_FORMATS:
+        try:
+            return timezone.make_aware(datetime.strptime(value, fmt))
+        except ValueError:
+            continue
+    raise CommandError("Invalid date %r" % value)
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a Razorpay settlement report (CSV) into RazorpaySettlement "
+        "and match each line to its RazorpayTransaction")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help="Rows inserted per bulk_create call")
+
+    def open_report(self, path):
+        if six.PY2:
+            return open(path, 'rb')
+        return io.open(path, newline='', encoding='utf-8-sig')
+
+    def build_settlement(self, row):
+        entity_id = row['entity_id']
+        return RazorpaySettlement(
+            settlement_id=row.get('settlement_id') or None,
+            entity_id=entity_id,
+            entity_type=row.get('type') or '',
+            rz_id=row.get('payment_id') or entity_id,
+            amount=parse_amount(row.get('amount')),
+            debit=parse_amount(row.get('debit')),
+            credit=parse_amount(row.get('credit')),
+            fee=parse_amount(row.get('fee')),
+            tax=parse_amount(row.get('tax')),
+            currency=row.get('currency') or None,
+            settled_at=parse_datetime(row.get('settled_at')),
+        )
+
+    def insert_new(self, chunk, db):
+        """
+        Insert the settlements in ``chunk`` that aren't stored yet and return
+        how many were inserted, so a report can be ingested again safely.
+        """
+        existing = set(RazorpaySettlement.objects.using(db).filter(
+            entity_id__in=[settlement.entity_id for settlement in chunk],
+        ).values_list('entity_id', 'settlement_id'))
+        new = []
+        for settlement in chunk:
+            key = (settlement.entity_id, settlement.settlement_id)
+            if key not in existing:
+                existing.add(key)
+                new.append(settlement)
+        RazorpaySettlement.objects.using(db).bulk_create(new)
+        return len(new)
+
+    def match(self, chunk, db):
+        """
+        Link the lines for the payments in ``chunk`` to their transactions,
+        including lines earlier imports couldn't match yet, and return the
+        entity ids in ``chunk`` that are still unmatched.
+        """
+        lines = RazorpaySettlement.objects.using(db).filter(
+            rz_id__in=set(settlement.rz_id for settlement in chunk),
+            transaction__isnull=True)
+        txns = RazorpayTransaction.objects.using(db).filter(
+            rz_id=OuterRef('rz_id')).values('pk')[:1]
+        lines.update(transaction=Subquery(txns))
+        return list(lines.filter(
+            entity_id__in=[settlement.entity_id for settlement in chunk],
+        ).values_list('entity_id', flat=True))
+
+    def handle(self, path, **options):
+        db = router.db_for_write(RazorpaySettlement)
+        with transaction.atomic(using=db):
+            self.ingest(path, db, options['chunk_size'])
+
+    def ingest(self, path, db, chunk_size):
+        rows, inserted, unmatched = 0, 0, []
+        fee, tax = Decimal(0), Decimal(0)
+        with self.open_report(path) as fh:
+            reader = csv.DictReader(fh)
+            if 'entity_id' not in (reader.fieldnames or []):
+                raise CommandError(
+                    "%s doesn't look like a settlement report" % path)
+            chunk = []
+            for row in reader:
+                settlement = self.build_settlement(row)
+                fee += settlement.fee
+                tax += settlement.tax
+                chunk.append(settlement)
+                if len(chunk) >= chunk_size:
+                    inserted += self.insert_new(chunk, db)
+                    unmatched.extend(self.match(chunk, db))
+                    rows += len(chunk)
+                    chunk = []
+            if chunk:
+                inserted += self.insert_new(chunk, db)
+                unmatched.extend(self.match(chunk, db))
+                rows += len(chunk)
+
+        self.stdout.write(
+            "Imported %d of %d rows (the rest were already stored), "
+            "%d unmatched. Fees: %s, tax: %s" % (
+                inserted, rows, len(unmatched), fee, tax))
+        for entity_id in unmatched[:20]:
+            self.stdout.write("Unmatched: %s" % entity_id)
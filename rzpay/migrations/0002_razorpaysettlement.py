@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rzpay', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RazorpaySettlement',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('settlement_id', models.CharField(blank=True, db_index=True, max_length=32, null=True)),
+                ('entity_id', models.CharField(max_length=32)),
+                ('entity_type', models.CharField(max_length=32)),
+                ('rz_id', models.CharField(blank=True, db_index=True, max_length=32, null=True)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('fee', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('tax', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('currency', models.CharField(blank=True, max_length=8, null=True)),
+                ('settled_at', models.DateTimeField(blank=True, null=True)),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='settlements', to='rzpay.RazorpayTransaction')),
+            ],
+            options={
+                'ordering': ('-date_created',),
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from ._indexes import create_index, drop_index
+
+TABLE = 'rzpay_razorpaytransaction'
+DATE_INDEX = 'rzpay_txn_date_created_idx'
+EMAIL_INDEX = 'rzpay_txn_email_idx'
+# Email prefix searches need a pattern index on PostgreSQL
+EMAIL_LIKE_INDEX = 'rzpay_txn_email_like'
+
+
+def create_like_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s '
+            '(email varchar_pattern_ops)' % (EMAIL_LIKE_INDEX, TABLE))
+
+
+def drop_like_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX CONCURRENTLY IF EXISTS %s' % EMAIL_LIKE_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    # Indexes are built concurrently, outside a transaction
+    atomic = False
+
+    dependencies = [
+        ('rzpay', '0002_razorpaysettlement'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    create_index(TABLE, DATE_INDEX, ['date_created']),
+                    drop_index(TABLE, DATE_INDEX)),
+                migrations.RunPython(
+                    create_index(TABLE, EMAIL_INDEX, ['email']),
+                    drop_index(TABLE, EMAIL_INDEX)),
+                migrations.RunPython(create_like_index, drop_like_index),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='razorpaytransaction',
+                    name='date_created',
+                    field=models.DateTimeField(auto_now_add=True, db_index=True),
+                ),
+                migrations.AlterField(
+                    model_name='razorpaytransaction',
+                    name='email',
+                    field=models.EmailField(blank=True, db_index=True, max_length=254, null=True),
+                ),
+            ],
+        ),
+    ]
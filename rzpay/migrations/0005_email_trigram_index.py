@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Trigram index for partial email searches, PostgreSQL only.
+
+The index needs the pg_trgm extension, which this migration doesn't create
+as that takes superuser rights. Without it the index is skipped with a
+warning and searches match email prefixes instead. To add the index later,
+install the extension in the payments database and build it by hand::
+
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX CONCURRENTLY rzpay_razorpaytransaction_email_trgm
+        ON rzpay_razorpaytransaction USING gin (UPPER(email::text) gin_trgm_ops);
+"""
+from __future__ import unicode_literals
+import logging
+
+from django.conf import settings
+from django.db import migrations
+
+logger = logging.getLogger('razorpay')
+
+# Matches the UPPER(...) LIKE UPPER(...) that Django generates for icontains
+CREATE_SQL = (
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+    "rzpay_razorpaytransaction_email_trgm ON rzpay_razorpaytransaction "
+    "USING gin (UPPER(email::text) gin_trgm_ops)")
+DROP_SQL = (
+    "DROP INDEX CONCURRENTLY IF EXISTS rzpay_razorpaytransaction_email_trgm")
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if (connection.vendor != 'postgresql' or
+            not getattr(settings, 'RAZORPAY_SEARCH_TRIGRAM', True)):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        installed = cursor.fetchone()
+    if not installed:
+        logger.warning(
+            "Skipping the rzpay email search index as the pg_trgm extension "
+            "isn't installed in database %r; email searches will match "
+            "prefixes only", connection.settings_dict['NAME'])
+        return
+    schema_editor.execute(CREATE_SQL)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    # Indexes can't be built concurrently inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('rzpay', '0004_user_without_constraint'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
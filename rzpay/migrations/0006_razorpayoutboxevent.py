@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rzpay', '0005_email_trigram_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RazorpayOutboxEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('event_type', models.CharField(max_length=32)),
+                ('payload', models.TextField()),
+                ('date_dispatched', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.CharField(blank=True, max_length=256, null=True)),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='outbox_events', to='rzpay.RazorpayTransaction')),
+            ],
+            options={
+                'ordering': ('pk',),
+            },
+        ),
+    ]
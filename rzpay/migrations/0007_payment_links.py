@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rzpay', '0006_razorpayoutboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='razorpaytransaction',
+            name='invoice_id',
+            field=models.CharField(blank=True, db_index=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='razorpaytransaction',
+            name='short_url',
+            field=models.URLField(blank=True, null=True),
+        ),
+    ]
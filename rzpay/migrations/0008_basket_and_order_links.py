@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from ._indexes import create_index, drop_index
+
+TABLE = 'rzpay_razorpaytransaction'
+BASKET_INDEX = 'rzpay_txn_frozen_basket_idx'
+ORDER_INDEX = 'rzpay_txn_order_number_idx'
+
+
+class Migration(migrations.Migration):
+
+    # The new columns are indexed concurrently, outside a transaction
+    atomic = False
+
+    dependencies = [
+        ('basket', '__first__'),
+        ('order', '__first__'),
+        ('rzpay', '0007_payment_links'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.AddField(
+                    model_name='razorpaytransaction',
+                    name='frozen_basket',
+                    field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='razorpay_transactions', to='basket.Basket'),
+                ),
+                migrations.AddField(
+                    model_name='razorpaytransaction',
+                    name='order',
+                    field=models.ForeignKey(blank=True, db_column='order_number', db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='razorpay_transactions', to='order.Order', to_field='number'),
+                ),
+                migrations.RunPython(
+                    create_index(TABLE, BASKET_INDEX, ['frozen_basket_id']),
+                    drop_index(TABLE, BASKET_INDEX)),
+                migrations.RunPython(
+                    create_index(TABLE, ORDER_INDEX, ['order_number']),
+                    drop_index(TABLE, ORDER_INDEX)),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='razorpaytransaction',
+                    name='frozen_basket',
+                    field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='razorpay_transactions', to='basket.Basket'),
+                ),
+                migrations.AddField(
+                    model_name='razorpaytransaction',
+                    name='order',
+                    field=models.ForeignKey(blank=True, db_column='order_number', db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='razorpay_transactions', to='order.Order', to_field='number'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models, router
+from django.db.models import (
+    Case, CharField, Max, Min, OuterRef, Subquery, Value, When)
+from django.db.models.functions import Cast
+
+CHUNK_SIZE = 10000
+
+
+def backfill(apps, schema_editor):
+    """
+    Fill in frozen_basket and order for existing transactions.
+
+    The migration isn't atomic and each chunk of primary keys is updated by
+    set-based statements of its own, so locks are short and the table stays
+    usable meanwhile.
+    """
+    Transaction = apps.get_model('rzpay', 'RazorpayTransaction')
+    Order = apps.get_model('order', 'Order')
+    db = schema_editor.connection.alias
+    transactions = Transaction.objects.using(db)
+    # Orders can only be joined when they're in the payments database
+    same_database = router.db_for_read(Order) == db
+    bounds = transactions.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return
+    for lo in range(bounds['first'], bounds['last'] + 1, CHUNK_SIZE):
+        chunk = transactions.filter(pk__gte=lo, pk__lt=lo + CHUNK_SIZE)
+        chunk.filter(
+            frozen_basket__isnull=True, basket_id__regex=r'^[0-9]+$',
+        ).update(frozen_basket=Cast('basket_id', models.IntegerField()))
+
+        # Orders are placed from the basket of a captured transaction
+        unlinked = chunk.filter(
+            status='captured', order__isnull=True,
+            frozen_basket__isnull=False)
+        if same_database:
+            unlinked.update(order=Subquery(Order.objects.filter(
+                basket_id=OuterRef('frozen_basket_id')
+            ).values('number')[:1]))
+            continue
+        captured = dict(unlinked.values_list('frozen_basket_id', 'pk'))
+        if not captured:
+            continue
+        numbers = dict(Order.objects.filter(
+            basket_id__in=list(captured)).values_list('basket_id', 'number'))
+        if numbers:
+            transactions.filter(
+                pk__in=[captured[basket_id] for basket_id in numbers]
+            ).update(order=Case(*[
+                When(pk=captured[basket_id], then=Value(number))
+                for basket_id, number in numbers.items()
+            ], output_field=CharField()))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('order', '__first__'),
+        ('rzpay', '0008_basket_and_order_links'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
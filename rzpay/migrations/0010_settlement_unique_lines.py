@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rzpay', '0009_backfill_basket_and_order_links'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='razorpaysettlement',
+            unique_together=set([('entity_id', 'settlement_id')]),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from ._indexes import create_index, drop_index
+
+TABLE = 'rzpay_razorpaytransaction'
+INDEX = 'rzpay_txn_status_id_idx'
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('rzpay', '0010_settlement_unique_lines'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    create_index(TABLE, INDEX, ['status', 'id']),
+                    drop_index(TABLE, INDEX)),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='razorpaytransaction',
+                    index=models.Index(fields=['status', 'id'], name=INDEX),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rzpay', '0011_transaction_status_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='razorpayoutboxevent',
+            name='next_attempt',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='razorpayoutboxevent',
+            name='date_abandoned',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
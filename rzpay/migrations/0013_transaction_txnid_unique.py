@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Make txnid unique, so concurrent runs can't create the same payment link
+transaction twice.
+
+On PostgreSQL the unique index is built concurrently and then attached as
+the constraint, and the plain index it replaces is dropped concurrently.
+"""
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import rzpay.models
+
+from ._indexes import create_index, drop_index
+
+TABLE = 'rzpay_razorpaytransaction'
+UNIQUE = 'rzpay_txn_txnid_uniq'
+PLAIN = 'rzpay_txn_txnid_idx'
+
+
+def txnid_fields(model):
+    """
+    The indexed txnid field of ``model`` and its unique replacement.
+    """
+    plain = model._meta.get_field('txnid')
+    name, path, args, kwargs = plain.deconstruct()
+    kwargs.pop('db_index', None)
+    unique = plain.__class__(*args, unique=True, **kwargs)
+    unique.set_attributes_from_name(name)
+    unique.model = model
+    return plain, unique
+
+
+def plain_txnid_indexes(connection):
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, TABLE)
+    # Keep the varchar_pattern_ops index Django adds for LIKE lookups
+    return [name for name, info in constraints.items()
+            if info['columns'] == ['txnid'] and info['index'] and
+            not info['unique'] and not name.endswith('_like')]
+
+
+def make_unique(apps, schema_editor):
+    connection = schema_editor.connection
+    model = apps.get_model('rzpay', 'RazorpayTransaction')
+    if connection.vendor != 'postgresql':
+        schema_editor.alter_field(model, *txnid_fields(model))
+        return
+    quote = schema_editor.quote_name
+    plain = plain_txnid_indexes(connection)
+    create_index(TABLE, UNIQUE, ['txnid'], unique=True)(apps, schema_editor)
+    # Not atomic, so an earlier attempt may have got this far
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_constraint WHERE conname = %s", [UNIQUE])
+        attached = cursor.fetchone()
+    if not attached:
+        schema_editor.execute(
+            'ALTER TABLE %s ADD CONSTRAINT %s UNIQUE USING INDEX %s' % (
+                quote(TABLE), quote(UNIQUE), quote(UNIQUE)))
+    for name in plain:
+        drop_index(TABLE, name)(apps, schema_editor)
+
+
+def make_plain(apps, schema_editor):
+    connection = schema_editor.connection
+    model = apps.get_model('rzpay', 'RazorpayTransaction')
+    if connection.vendor != 'postgresql':
+        plain, unique = txnid_fields(model)
+        schema_editor.alter_field(model, unique, plain)
+        return
+    quote = schema_editor.quote_name
+    create_index(TABLE, PLAIN, ['txnid'])(apps, schema_editor)
+    schema_editor.execute('ALTER TABLE %s DROP CONSTRAINT %s' % (
+        quote(TABLE), quote(UNIQUE)))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('rzpay', '0012_outbox_retry_backoff'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(make_unique, make_plain),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='razorpaytransaction',
+                    name='txnid',
+                    field=models.CharField(default=rzpay.models.generate_id, max_length=32, unique=True),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+"""
+Build and drop indexes without blocking writes to large tables.
+
+Migrations using these must set ``atomic = False``, since PostgreSQL can't
+build an index concurrently inside a transaction.
+"""
+from __future__ import unicode_literals
+
+
+def create_index(table, name, columns, unique=False):
+    def forwards(apps, schema_editor):
+        quote = schema_editor.quote_name
+        sql = 'CREATE %sINDEX %%s ON %%s (%%s)'
+        if schema_editor.connection.vendor == 'postgresql':
+            sql = 'CREATE %sINDEX CONCURRENTLY IF NOT EXISTS %%s ON %%s (%%s)'
+        sql = sql % ('UNIQUE ' if unique else '')
+        schema_editor.execute(sql % (
+            quote(name), quote(table),
+            ', '.join(quote(column) for column in columns)))
+    return forwards
+
+
+def drop_index(table, name):
+    def backwards(apps, schema_editor):
+        quote = schema_editor.quote_name
+        vendor = schema_editor.connection.vendor
+        if vendor == 'postgresql':
+            sql = 'DROP INDEX CONCURRENTLY IF EXISTS %s' % quote(name)
+        elif vendor == 'mysql':
+            sql = 'DROP INDEX %s ON %s' % (quote(name), quote(table))
+        else:
+            # SQLite loses these when later migrations rebuild the table
+            sql = 'DROP INDEX IF EXISTS %s' % quote(name)
+        schema_editor.execute(sql)
+    return backwards
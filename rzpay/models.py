@@ -1,5 +1,6 @@
 from __future__ import unicode_literals
 from uuid import uuid4
+import json
 
 from django.db import models
 from django.conf import settings
@@ -12,17 +13,31 @@ def generate_id():
 
 @python_2_unicode_compatible
 class RazorpayTransaction(models.Model):
-    date_created = models.DateTimeField(auto_now_add=True)
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+    # No constraint so payments can live in their own database, see
+    # rzpay.routers
     user = models.ForeignKey(
-        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
+        db_constraint=False
     )
-    email = models.EmailField(null=True, blank=True)
+    email = models.EmailField(null=True, blank=True, db_index=True)
     txnid = models.CharField(
-        max_length=32, db_index=True, default=generate_id
+        max_length=32, unique=True, default=generate_id
     )
     basket_id = models.CharField(
         max_length=12, null=True, blank=True, db_index=True
     )
+    # Typed links to Oscar for joins. Like user they have no constraints, and
+    # the order can be recorded before Oscar has saved it.
+    frozen_basket = models.ForeignKey(
+        'basket.Basket', on_delete=models.SET_NULL, null=True, blank=True,
+        db_constraint=False, related_name='razorpay_transactions'
+    )
+    order = models.ForeignKey(
+        'order.Order', to_field='number', db_column='order_number',
+        on_delete=models.SET_NULL, null=True, blank=True,
+        db_constraint=False, related_name='razorpay_transactions'
+    )
 
     amount = models.DecimalField(max_digits=12, decimal_places=2, null=True,
                                  blank=True)
@@ -32,11 +47,18 @@ class RazorpayTransaction(models.Model):
     INITIATED, CAPTURED, AUTHORIZED, CAPTURE_FAILED, AUTH_FAILED = (
         "initiated", "captured", "authorized", "capfailed", "authfailed"
     )
+    # A payment link has been sent for the transaction
+    ISSUED = "issued"
     status = models.CharField(max_length=32)
 
     rz_id = models.CharField(
         max_length=32, null=True, blank=True, db_index=True
     )
+    # Set for payment links
+    invoice_id = models.CharField(
+        max_length=32, null=True, blank=True, db_index=True
+    )
+    short_url = models.URLField(null=True, blank=True)
 
     error_code = models.CharField(max_length=32, null=True, blank=True)
     error_message = models.CharField(max_length=256, null=True, blank=True)
@@ -44,6 +66,11 @@ class RazorpayTransaction(models.Model):
     class Meta:
         ordering = ('-date_created',)
         app_label = 'rzpay'
+        indexes = [
+            # Status filters listed newest first
+            models.Index(fields=['status', 'id'],
+                         name='rzpay_txn_status_id_idx'),
+        ]
 
     @property
     def is_successful(self):
@@ -57,8 +84,109 @@ class RazorpayTransaction(models.Model):
     def is_failed(self):
         # TODO: Probably mark abandoned transactions as failed in batch
         return self.status not in (
-            self.CAPTURED, self.AUTHORIZED, self.INITIATED
+            self.CAPTURED, self.AUTHORIZED, self.INITIATED, self.ISSUED
         )
 
     def __str__(self):
         return 'razorpay payment: %s' % self.rz_id
+
+
+@python_2_unicode_compatible
+class RazorpaySettlement(models.Model):
+    """
+    A line from a Razorpay settlement (recon) report.
+    """
+    date_created = models.DateTimeField(auto_now_add=True)
+    settlement_id = models.CharField(
+        max_length=32, null=True, blank=True, db_index=True
+    )
+    entity_id = models.CharField(max_length=32)
+    entity_type = models.CharField(max_length=32)
+    # The payment this line belongs to, which for refunds and adjustments
+    # differs from entity_id
+    rz_id = models.CharField(
+        max_length=32, null=True, blank=True, db_index=True
+    )
+
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    debit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    credit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    fee = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    tax = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    currency = models.CharField(max_length=8, null=True, blank=True)
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    transaction = models.ForeignKey(
+        RazorpayTransaction, on_delete=models.SET_NULL, null=True,
+        blank=True, related_name='settlements'
+    )
+
+    class Meta:
+        ordering = ('-date_created',)
+        app_label = 'rzpay'
+        # Entity first so ingestion can look up a chunk's existing lines
+        unique_together = ('entity_id', 'settlement_id')
+
+    @property
+    def is_matched(self):
+        return self.transaction_id is not None
+
+    def __str__(self):
+        return 'razorpay settlement: %s' % self.entity_id
+
+
+@python_2_unicode_compatible
+class RazorpayOutboxEvent(models.Model):
+    """
+    A payment lifecycle event waiting to be delivered to downstream systems.
+
+    Events are written in the same database transaction as the change they
+    describe and delivered by ``rzpay.outbox.dispatch_events``.
+    """
+    date_created = models.DateTimeField(auto_now_add=True)
+    transaction = models.ForeignKey(
+        RazorpayTransaction, on_delete=models.SET_NULL, null=True,
+        blank=True, related_name='outbox_events'
+    )
+
+    INITIATED, ISSUED, AUTHORIZED, CAPTURED, FAILED, REFUNDED = (
+        "initiated", "issued", "authorized", "captured", "failed", "refunded"
+    )
+    event_type = models.CharField(max_length=32)
+    # JSON encoded
+    payload = models.TextField()
+
+    date_dispatched = models.DateTimeField(null=True, blank=True,
+                                           db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.CharField(max_length=256, null=True, blank=True)
+    # Failed events wait until then before being retried
+    next_attempt = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Set when delivery is given up after too many attempts
+    date_abandoned = models.DateTimeField(null=True, blank=True,
+                                          db_index=True)
+
+    class Meta:
+        ordering = ('pk',)
+        app_label = 'rzpay'
+
+    @classmethod
+    def for_transaction(cls, txn, event_type, **data):
+        """
+        Build an (unsaved) event describing the current state of ``txn``.
+        """
+        payload = {
+            "txnid": txn.txnid,
+            "rz_id": txn.rz_id,
+            "status": txn.status,
+            "amount": "%s" % txn.amount,
+            "currency": txn.currency,
+            "basket_id": txn.basket_id,
+            "email": txn.email,
+        }
+        payload.update(data)
+        return cls(transaction=txn, event_type=event_type,
+                   payload=json.dumps(payload))
+
+    def __str__(self):
+        return 'razorpay %s event #%s' % (self.event_type, self.pk)
@@ -0,0 +1,169 @@
+"""
+Delivery of payment lifecycle events from the outbox table.
+
+The facade writes a ``RazorpayOutboxEvent`` in the same database transaction
+as each payment change. ``dispatch_events`` (run by the
+``dispatch_payment_events`` command) drains them in batches and hands them to
+every sink listed in ``RAZORPAY_OUTBOX_SINKS``. An event is only marked as
+dispatched once all sinks have accepted it, so delivery is at-least-once and
+sinks should tolerate duplicates.
+
+Failed events are retried with exponential back-off starting at
+``RAZORPAY_OUTBOX_BACKOFF`` seconds, while later events keep flowing. After
+``RAZORPAY_OUTBOX_MAX_ATTEMPTS`` failures an event is abandoned; see the
+command's ``--retry-dead`` option.
+"""
+from __future__ import unicode_literals
+from datetime import timedelta
+import io
+import json
+import logging
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+import requests
+
+from .models import RazorpayOutboxEvent as OutboxEvent
+from .signals import payment_event
+
+logger = logging.getLogger('razorpay')
+
+
+def serialize(event):
+    return {
+        "id": event.pk,
+        "type": event.event_type,
+        "date_created": event.date_created.isoformat(),
+        "payload": json.loads(event.payload),
+    }
+
+
+class SignalSink(object):
+    """
+    Send the ``rzpay.signals.payment_event`` signal for each event.
+    """
+
+    def deliver(self, events):
+        for event in events:
+            payment_event.send(sender=OutboxEvent, event=event,
+                               payload=json.loads(event.payload))
+
+
+class WebhookSink(object):
+    """
+    POST each batch as a JSON list to ``RAZORPAY_OUTBOX_WEBHOOK_URL``.
+    """
+
+    def __init__(self):
+        self.url = settings.RAZORPAY_OUTBOX_WEBHOOK_URL
+        self.timeout = getattr(settings, 'RAZORPAY_OUTBOX_WEBHOOK_TIMEOUT', 10)
+
+    def deliver(self, events):
+        response = requests.post(
+            self.url, json=[serialize(event) for event in events],
+            timeout=self.timeout)
+        response.raise_for_status()
+
+
+class FileSink(object):
+    """
+    Append each event as a line of JSON to ``RAZORPAY_OUTBOX_FILE``.
+    """
+
+    def __init__(self):
+        self.path = settings.RAZORPAY_OUTBOX_FILE
+
+    def deliver(self, events):
+        with io.open(self.path, 'a', encoding='utf-8') as fh:
+            for event in events:
+                fh.write("%s\n" % json.dumps(serialize(event)))
+
+
+def get_sinks():
+    paths = getattr(settings, 'RAZORPAY_OUTBOX_SINKS',
+                    ['rzpay.outbox.SignalSink'])
+    return [import_string(path)() for path in paths]
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait before retrying an event that has failed ``attempts``
+    times.
+    """
+    base = getattr(settings, 'RAZORPAY_OUTBOX_BACKOFF', 30)
+    return min(base * 2 ** (attempts - 1),
+               getattr(settings, 'RAZORPAY_OUTBOX_MAX_BACKOFF', 3600))
+
+
+def record_failure(events, error, db):
+    max_attempts = getattr(settings, 'RAZORPAY_OUTBOX_MAX_ATTEMPTS', 10)
+    now = timezone.now()
+    for event in events:
+        event.attempts += 1
+        event.last_error = ("%s" % error)[:256]
+        if event.attempts >= max_attempts:
+            logger.error("Giving up on payment event %s after %d attempts: "
+                         "%s", event.pk, event.attempts, error)
+            event.next_attempt, event.date_abandoned = None, now
+        else:
+            event.next_attempt = now + timedelta(
+                seconds=retry_delay(event.attempts))
+        event.save(using=db, update_fields=[
+            'attempts', 'last_error', 'next_attempt', 'date_abandoned'])
+
+
+def deliver(events, sinks, db):
+    """
+    Hand ``events`` to every sink and record the outcome. Returns whether
+    all sinks accepted them.
+    """
+    try:
+        for sink in sinks:
+            sink.deliver(events)
+    except Exception as e:
+        logger.warning("Couldn't deliver %d payment events: %s",
+                       len(events), e)
+        record_failure(events, e, db)
+        return False
+    OutboxEvent.objects.using(db).filter(
+        pk__in=[event.pk for event in events]
+    ).update(attempts=F('attempts') + 1, date_dispatched=timezone.now(),
+             next_attempt=None, last_error=None)
+    return True
+
+
+def dispatch_events(batch_size=100, sinks=None):
+    """
+    Deliver the oldest batch of due events and return how many were
+    dispatched.
+
+    Rows are locked while they're delivered, so several dispatchers can run
+    at once on databases that support ``SKIP LOCKED``.
+    """
+    if sinks is None:
+        sinks = get_sinks()
+    db = router.db_for_write(OutboxEvent)
+    skip_locked = connections[db].features.has_select_for_update_skip_locked
+    with transaction.atomic(using=db):
+        events = list(
+            OutboxEvent.objects.using(db)
+            .select_for_update(skip_locked=skip_locked)
+            .filter(date_dispatched__isnull=True,
+                    date_abandoned__isnull=True)
+            .filter(Q(next_attempt__isnull=True) |
+                    Q(next_attempt__lte=timezone.now()))
+            .order_by('pk')[:batch_size])
+        # Retries go one at a time, so an event a sink keeps rejecting
+        # can't fail the events around it
+        fresh = [event for event in events if not event.attempts]
+        groups = [fresh] if fresh else []
+        groups.extend([event] for event in events if event.attempts)
+        dispatched = 0
+        for group in groups:
+            if deliver(group, sinks, db):
+                dispatched += len(group)
+    return dispatched
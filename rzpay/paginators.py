@@ -0,0 +1,34 @@
+"""
+Paginators for listings of large payment tables.
+"""
+from __future__ import unicode_literals
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Use the planner's row estimate instead of ``COUNT(*)`` on PostgreSQL
+    when the listing is large, filtered or not.
+    """
+
+    threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.order_by().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0]
+            if not isinstance(plan, list):
+                plan = json.loads(plan)
+            estimate = plan[0]['Plan']['Plan Rows']
+            if estimate >= self.threshold:
+                return int(estimate)
+        return super(EstimatedCountPaginator, self).count
@@ -0,0 +1,115 @@
+"""
+Optional database router for the rzpay app.
+
+Add it to your settings to keep payment tables on their own database::
+
+    DATABASE_ROUTERS = ['rzpay.routers.PaymentsRouter']
+    RAZORPAY_DATABASE = 'payments'
+    RAZORPAY_REPLICA_DATABASE = 'payments_replica'
+
+Everything is read from and written to ``RAZORPAY_DATABASE``, except code
+running under ``replica_reads`` (the dashboard and admin listings), which reads
+from ``RAZORPAY_REPLICA_DATABASE``. Once such code writes, its later reads go
+back to the primary so it always sees its own changes.
+
+Users and Oscar objects related to transactions are expected on ``default``;
+list any router for those apps before this one.
+"""
+from __future__ import unicode_literals
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router
+from django.utils.decorators import ContextDecorator
+
+_state = threading.local()
+
+
+def primary_database():
+    return getattr(settings, 'RAZORPAY_DATABASE', 'default')
+
+
+def replica_database():
+    return getattr(settings, 'RAZORPAY_REPLICA_DATABASE', None)
+
+
+class replica_reads(ContextDecorator):
+    """
+    Send reads of rzpay models to the replica until the block writes.
+    """
+
+    def __enter__(self):
+        # Instances are shared between threads when used as decorators, so
+        # the state to restore lives in the thread local
+        if not hasattr(_state, 'stack'):
+            _state.stack = []
+        _state.stack.append((getattr(_state, 'replica', False),
+                             getattr(_state, 'wrote', False)))
+        _state.replica, _state.wrote = True, False
+
+    def __exit__(self, *exc_info):
+        wrote = _state.wrote
+        _state.replica, _state.wrote = _state.stack.pop()
+        _state.wrote = _state.wrote or wrote
+
+
+def with_related(queryset, *fields):
+    """
+    Load the objects behind foreign keys ``fields`` along with ``queryset``.
+
+    They're joined when their table is read from the queryset's database,
+    and fetched with one query on their own database otherwise.
+    """
+    joined, fetched = [], []
+    for name in fields:
+        related = queryset.model._meta.get_field(name).related_model
+        if router.db_for_read(related) == queryset.db:
+            joined.append(name)
+        else:
+            fetched.append(name)
+    if joined:
+        queryset = queryset.select_related(*joined)
+    if fetched:
+        queryset = queryset.prefetch_related(*fetched)
+    return queryset
+
+
+class PaymentsRouter(object):
+    app_label = 'rzpay'
+
+    def _related_database(self, hints):
+        # Django would otherwise follow a transaction onto our database when
+        # loading the user or Oscar object it points at
+        instance = hints.get('instance')
+        if (instance is not None and
+                instance._meta.app_label == self.app_label):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != self.app_label:
+            return self._related_database(hints)
+        replica = replica_database()
+        if (replica and getattr(_state, 'replica', False) and
+                not getattr(_state, 'wrote', False)):
+            return replica
+        return primary_database()
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != self.app_label:
+            return self._related_database(hints)
+        _state.wrote = True
+        return primary_database()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Transactions point at users (and Oscar objects) which may live in
+        # another database; those foreign keys don't have constraints.
+        labels = (obj1._meta.app_label, obj2._meta.app_label)
+        if self.app_label in labels:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == self.app_label:
+            return db == primary_database()
+        return None
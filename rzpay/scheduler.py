@@ -0,0 +1,155 @@
+"""
+Rate-limit-aware scheduling of calls to the Razorpay API.
+
+All worker processes share one request budget through the Django cache, so
+bulk jobs (reconciliation, refunds, status refreshes) can run alongside live
+checkouts without exhausting Razorpay's rate limit.
+"""
+from __future__ import unicode_literals
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger('razorpay')
+
+INTERACTIVE, BATCH = "interactive", "batch"
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a call can't be scheduled before its deadline.
+    """
+
+
+def is_rate_limit_error(exc):
+    """
+    Whether the gateway rejected a call with HTTP 429.
+
+    The razorpay client doesn't expose the status code so we fall back to the
+    error description.
+    """
+    if getattr(exc, 'status_code', None) == 429:
+        return True
+    return 'too many requests' in ('%s' % exc).lower()
+
+
+class GatewayScheduler(object):
+    """
+    A token bucket shared across processes through the Django cache.
+
+    Tokens are handed out from one-second windows, so each window grants at
+    most ``rate`` calls. Batch calls may only use ``batch_share`` of a window
+    and back off entirely while an interactive call is waiting, which means
+    checkouts always pre-empt background work. A 429 from the gateway halves
+    the shared rate for ``recovery`` seconds instead of failing the caller.
+    """
+
+    key_prefix = 'rzpay:scheduler'
+    poll_interval = 0.05
+
+    def __init__(self, rate=None, batch_share=None, min_rate=None,
+                 recovery=None, cache_alias=None):
+        self.rate = rate or getattr(settings, 'RAZORPAY_RATE_LIMIT', 20)
+        self.batch_share = batch_share or getattr(
+            settings, 'RAZORPAY_BATCH_RATE_SHARE', 0.5)
+        self.min_rate = min_rate or getattr(
+            settings, 'RAZORPAY_MIN_RATE_LIMIT', 1)
+        self.recovery = recovery or getattr(
+            settings, 'RAZORPAY_RATE_LIMIT_RECOVERY', 30)
+        self.cache_alias = cache_alias or getattr(
+            settings, 'RAZORPAY_CACHE', 'default')
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _key(self, name):
+        return '%s:%s' % (self.key_prefix, name)
+
+    def current_rate(self):
+        """
+        The calls per second currently allowed, after any 429 back-off.
+        """
+        return self.cache.get(self._key('rate')) or self.rate
+
+    def _take(self, limit):
+        """
+        Take a token from the current window if fewer than ``limit`` have
+        been granted. Refused attempts leave the count untouched, so callers
+        polling for a full share don't starve anyone else.
+        """
+        window = int(time.time())
+        key = self._key('window:%d' % window)
+        if (self.cache.get(key) or 0) >= limit:
+            return False
+        self.cache.add(key, 0, 2)
+        try:
+            taken = self.cache.incr(key)
+        except ValueError:
+            # The window expired between add() and incr()
+            return False
+        if taken > limit:
+            # Lost a race for the last token; give it back
+            self.cache.decr(key)
+            return False
+        return True
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        """
+        Block until a token is available for a call of the given priority.
+
+        Raises ``RateLimitExceeded`` if none is granted within ``timeout``
+        seconds.
+        """
+        if timeout is None:
+            timeout = 10 if priority == INTERACTIVE else 300
+        deadline = time.time() + timeout
+        waiting_key = self._key('interactive-waiting')
+        while True:
+            rate = self.current_rate()
+            if priority == INTERACTIVE:
+                if self._take(rate):
+                    return
+                # Tell batch callers to stand aside until we get through
+                self.cache.set(waiting_key, True, 1)
+            elif (not self.cache.get(waiting_key) and
+                    self._take(max(1, int(rate * self.batch_share)))):
+                return
+            if time.time() >= deadline:
+                raise RateLimitExceeded(
+                    "No %s gateway slot within %ss" % (priority, timeout))
+            time.sleep(self.poll_interval)
+
+    def throttled(self):
+        """
+        Record a 429 from the gateway and halve the shared rate.
+        """
+        rate = max(self.min_rate, int(self.current_rate() / 2))
+        self.cache.set(self._key('rate'), rate, self.recovery)
+        logger.warning("Razorpay rate limited us - slowing to %s/s", rate)
+
+    def call(self, priority, func, *args, **kwargs):
+        """
+        Run ``func`` within the shared budget, retrying when rate limited.
+
+        Pass ``acquire_timeout`` to wait less than ``acquire``'s default for
+        each token.
+        """
+        acquire_timeout = kwargs.pop('acquire_timeout', None)
+        retries = getattr(settings, 'RAZORPAY_RATE_LIMIT_RETRIES', 3)
+        attempt = 0
+        while True:
+            self.acquire(priority, acquire_timeout)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= retries:
+                    raise
+                self.throttled()
+                attempt += 1
+                time.sleep(min(2 ** attempt * 0.1, 2))
+
+
+scheduler = GatewayScheduler()
@@ -0,0 +1,77 @@
+"""
+Index-friendly searching of Razorpay transactions.
+
+Each search is routed to a single indexed lookup depending on what the input
+looks like, instead of OR-ing ``icontains`` across columns.
+"""
+from __future__ import unicode_literals
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+
+RZ_ID_RE = re.compile(r'^[a-z]+_[A-Za-z0-9]{14}$')
+TXNID_RE = re.compile(r'^[0-9a-f]{28}$')
+BASKET_ID_RE = re.compile(r'^\d{1,12}$')
+
+# Shorter terms can't use a trigram index
+TRIGRAM_MIN_LENGTH = 3
+
+TRIGRAM_INDEX = 'rzpay_razorpaytransaction_email_trgm'
+
+# Whether the trigram index exists, by database alias
+_trigram_index = {}
+
+
+def has_trigram_index(alias):
+    """
+    Whether migration 0005 could build the trigram index. Checked once per
+    process, so restart after adding the index by hand.
+    """
+    if alias not in _trigram_index:
+        connection = connections[alias]
+        exists = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM pg_indexes WHERE indexname = %s",
+                    [TRIGRAM_INDEX])
+                exists = cursor.fetchone() is not None
+        _trigram_index[alias] = exists
+    return _trigram_index[alias]
+
+
+def use_trigram_index(queryset):
+    """
+    Whether partial email searches can use the trigram index created by
+    migration 0005. It's only there on PostgreSQL with pg_trgm installed.
+    """
+    if not getattr(settings, 'RAZORPAY_SEARCH_TRIGRAM', True):
+        return False
+    return has_trigram_index(queryset.db)
+
+
+def search_transactions(queryset, query):
+    """
+    Filter ``queryset`` by a search term typed by staff.
+
+    Razorpay ids, transaction ids, basket ids and order numbers are matched
+    exactly.
+    Anything else matches email addresses, anywhere in the address when the
+    trigram index is available and by prefix otherwise.
+    """
+    term = query.strip()
+    if not term:
+        return queryset
+    if RZ_ID_RE.match(term):
+        return queryset.filter(rz_id=term)
+    if TXNID_RE.match(term):
+        return queryset.filter(txnid=term)
+    if BASKET_ID_RE.match(term):
+        # Oscar's default order numbers are numeric too
+        return queryset.filter(
+            Q(frozen_basket_id=int(term)) | Q(order_id=term))
+    if len(term) >= TRIGRAM_MIN_LENGTH and use_trigram_index(queryset):
+        return queryset.filter(email__icontains=term)
+    return queryset.filter(email__startswith=term)
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Sent by rzpay.outbox.SignalSink for each payment lifecycle event
+payment_event = Signal(providing_args=['event', 'payload'])
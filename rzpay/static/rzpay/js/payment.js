@@ -0,0 +1,164 @@
+/*
+ * Opens the Razorpay checkout modal using the options rendered into the
+ * #rzpay-options element of rzpay/payment.html.
+ *
+ * Once the modal has rendered, page weight and time-to-modal are recorded
+ * in window.rzpayMetrics and as the "rzpay:time-to-modal" performance
+ * measure.
+ */
+(function () {
+    "use strict";
+
+    var data = JSON.parse(
+        document.getElementById("rzpay-options").textContent);
+
+    function query(params) {
+        var parts = [];
+        for (var key in params) {
+            if (params.hasOwnProperty(key)) {
+                parts.push(encodeURIComponent(key) + "=" +
+                           encodeURIComponent(params[key]));
+            }
+        }
+        return parts.join("&");
+    }
+
+    var MESSAGES = {
+        "initiated": "Confirming your payment\u2026",
+        "authorized": "Payment authorised, placing your order\u2026",
+        "captured": "Payment received, placing your order\u2026"
+    };
+
+    function showProgress(text) {
+        var el = document.getElementById("rzpay-progress");
+        if (!el) {
+            el = document.createElement("p");
+            el.id = "rzpay-progress";
+            el.style.cssText = "font:16px sans-serif;text-align:center;" +
+                               "margin-top:40vh";
+            document.body.appendChild(el);
+        }
+        el.textContent = text;
+    }
+
+    // Long-poll the status endpoint until the transaction settles or the
+    // success page replaces this one. Servers that can't hold the request
+    // answer at once, so don't ask more often than every two seconds.
+    function pollStatus(etag) {
+        var started = Date.now();
+        var xhr = new XMLHttpRequest();
+        xhr.open("GET", data.status_url + "?wait=20");
+        if (etag) {
+            xhr.setRequestHeader("If-None-Match", etag);
+        }
+        xhr.onload = function () {
+            if (xhr.status === 200) {
+                var state = JSON.parse(xhr.responseText);
+                if (MESSAGES[state.status]) {
+                    showProgress(MESSAGES[state.status]);
+                }
+                if (state.status === "captured") {
+                    return;
+                }
+            } else if (xhr.status !== 304) {
+                return;
+            }
+            var next = xhr.getResponseHeader("ETag");
+            setTimeout(function () {
+                pollStatus(next);
+            }, Math.max(0, 2000 - (Date.now() - started)));
+        };
+        xhr.send();
+    }
+
+    // The modal has rendered once Razorpay's checkout iframe has loaded
+    // and the browser has painted after open(). A frame that checkout.js
+    // created before this script ran has already loaded.
+    function onModalRendered(callback) {
+        var frameSelector = "iframe.razorpay-checkout-frame";
+        var pending = {frame: !document.querySelector(frameSelector),
+                       paint: true};
+
+        function ready(what) {
+            if (pending[what]) {
+                pending[what] = false;
+                if (!pending.frame && !pending.paint) {
+                    callback();
+                }
+            }
+        }
+
+        if (pending.frame && window.MutationObserver) {
+            var observer = new MutationObserver(function () {
+                var frame = document.querySelector(frameSelector);
+                if (frame) {
+                    observer.disconnect();
+                    frame.addEventListener("load", function () {
+                        ready("frame");
+                    });
+                }
+            });
+            observer.observe(document.body, {childList: true, subtree: true});
+        } else {
+            pending.frame = false;
+        }
+        // Call once the modal has been opened
+        return function () {
+            var raf = window.requestAnimationFrame || function (f) {
+                setTimeout(f, 16);
+            };
+            raf(function () {
+                raf(function () { ready("paint"); });
+            });
+        };
+    }
+
+    // Cross-origin resources without Timing-Allow-Origin report a zero
+    // transferSize, and the iframe's own subresources aren't listed here
+    function recordMetrics() {
+        var perf = window.performance;
+        if (!perf || !perf.getEntriesByType) {
+            return;
+        }
+        var bytes = 0;
+        var entries = perf.getEntriesByType("navigation").concat(
+            perf.getEntriesByType("resource"));
+        for (var i = 0; i < entries.length; i++) {
+            bytes += entries[i].transferSize || 0;
+        }
+        if (perf.measure) {
+            perf.measure("rzpay:time-to-modal");
+        }
+        window.rzpayMetrics = {
+            pageWeight: bytes,
+            timeToModal: perf.now()
+        };
+    }
+
+    var options = {
+        "key": data.key,
+        "amount": data.amount,
+        "name": data.name,
+        "description": data.description,
+        "image": data.image,
+        "theme": {"color": data.theme_color},
+        "handler": function (response) {
+            showProgress(MESSAGES.initiated);
+            pollStatus(null);
+            window.location = data.success_url + "?" + query({
+                "rz_id": response.razorpay_payment_id,
+                "txn_id": data.txn_id
+            });
+        },
+        "prefill": {"email": data.email},
+        "modal": {
+            "ondismiss": function () {
+                window.location = data.cancel_url;
+            }
+        },
+        "notes": {"txn_id": data.txn_id}
+    };
+    var opened = onModalRendered(recordMetrics);
+    new Razorpay(options).open();
+    opened();
+})();
@@ -0,0 +1,26 @@
+from django import template
+
+from .. import facade
+
+register = template.Library()
+
+
+@register.simple_tag
+def razorpay_available():
+    """
+    Whether to offer Razorpay at checkout, see ``facade.is_gateway_healthy``.
+    """
+    return facade.is_gateway_healthy()
+
+
+@register.simple_tag
+def older_transactions_url(cl):
+    """
+    Keyset link to the transactions after the last one on this page.
+    """
+    from django.contrib.admin.views.main import PAGE_VAR
+    from ..admin import BEFORE_VAR
+    results = list(cl.result_list)
+    if len(results) < cl.list_per_page:
+        return ''
+    return cl.get_query_string({BEFORE_VAR: results[-1].pk}, [PAGE_VAR])
@@ -11,4 +11,6 @@ urlpatterns = [
         name='razorpay-cancel-response'),
     url(r'^payment/', views.PaymentView.as_view(),
         name='razorpay-direct-payment'),
+    url(r'^status/(?P<txnid>[0-9a-f]+)/$', views.PaymentStatusView.as_view(),
+        name='razorpay-payment-status'),
 ]
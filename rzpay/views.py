@@ -1,13 +1,19 @@
 from __future__ import unicode_literals
+import hashlib
+import json
 import logging
+import time
 
 from django.views.generic import RedirectView, View
 from django.conf import settings
 from django.shortcuts import get_object_or_404, render
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect
+from django.http import (
+    Http404, HttpResponseNotModified, HttpResponseRedirect, JsonResponse)
+from django.templatetags.static import static
 from django.utils import six
+from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 
 from oscar.apps.payment.exceptions import UnableToTakePayment
@@ -36,6 +42,15 @@ Applicator = get_class('offer.applicator', 'Applicator')
 logger = logging.getLogger('razorpay')
 
 
+def json_script(data):
+    """
+    Serialise ``data`` so it can be embedded in a <script> element.
+    """
+    return mark_safe(
+        json.dumps(data).replace('<', '\\u003C').replace('>', '\\u003E')
+        .replace('&', '\\u0026'))
+
+
 class PaymentView(CheckoutSessionMixin, View):
     """
     Show the razorpay payment page and record the start of a transaction.
@@ -44,6 +59,13 @@ class PaymentView(CheckoutSessionMixin, View):
     template_name = 'rzpay/payment.html'
 
     def get(self, request, *args, **kwargs):
+        if not facade.is_gateway_healthy():
+            logger.warning("Razorpay is unhealthy - not starting a payment")
+            messages.error(
+                self.request,
+                _("Razorpay payments are temporarily unavailable - "
+                  "please try again in a few minutes"))
+            return HttpResponseRedirect(reverse('checkout:payment-details'))
         try:
             basket = self.build_submission()['basket']
             if basket.is_empty:
@@ -86,10 +108,13 @@ class PaymentView(CheckoutSessionMixin, View):
             email = self.build_submission()['order_kwargs']['guest_email']
             user = None
         txn = facade.start_razorpay_txn(basket, amount, user, email)
-        context = {
-            "basket": basket,
+        logo_url = getattr(settings, "RAZORPAY_VENDOR_LOGO", None)
+        if logo_url is None:
+            logo_url = self.request.build_absolute_uri(
+                static("rzpay/img/logo.svg"))
+        options = {
+            "key": settings.RAZORPAY_API_KEY,
             "amount": int(amount*100),  # amount in paisa as int
-            "rz_key": settings.RAZORPAY_API_KEY,
             "email": email,
             "txn_id": txn.txnid,
             "name": getattr(settings, "RAZORPAY_VENDOR_NAME", "My Store"),
@@ -99,13 +124,77 @@ class PaymentView(CheckoutSessionMixin, View):
             "theme_color": getattr(
                 settings, "RAZORPAY_THEME_COLOR", "#F37254"
             ),
-            "logo_url": getattr(
-                settings, "RAZORPAY_VENDOR_LOGO",
-                "https://via.placeholder.com/150x150"),
+            "image": logo_url,
+            "success_url": reverse('razorpay-success-response',
+                                   kwargs={'basket_id': basket.id}),
+            "cancel_url": reverse('razorpay-cancel-response',
+                                  kwargs={'basket_id': basket.id}),
+            "status_url": reverse('razorpay-payment-status',
+                                  kwargs={'txnid': txn.txnid}),
+        }
+        context = {
+            "basket": basket,
+            "txn_id": txn.txnid,
+            "options_json": json_script(options),
         }
         return context
 
 
+class PaymentStatusView(View):
+    """
+    JSON status of a transaction for the payment page to poll while the
+    order is being placed.
+
+    Supports conditional requests: if the status still matches the
+    ``If-None-Match`` header the request waits up to ``?wait=`` seconds
+    (capped by ``RAZORPAY_STATUS_POLL_TIMEOUT``) for it to change before
+    answering 304.
+
+    Waiting needs a cache shared by all workers (memcached, Redis) as
+    ``RAZORPAY_CACHE``, and holds a worker per waiting customer, so serve it
+    from threaded or async workers. With a per-process cache the view
+    answers at once from the database and the payment page falls back to
+    short polls.
+    """
+    poll_interval = 0.5
+
+    def get_etag(self, state):
+        payload = json.dumps(state, sort_keys=True).encode('utf-8')
+        return '"%s"' % hashlib.md5(payload).hexdigest()
+
+    def get(self, request, *args, **kwargs):
+        txnid = kwargs['txnid']
+        try:
+            wait = float(request.GET.get('wait', 0))
+        except ValueError:
+            wait = 0
+        wait = min(max(wait, 0),
+                   getattr(settings, 'RAZORPAY_STATUS_POLL_TIMEOUT', 20))
+        if not facade.status_cache_is_shared():
+            # Other workers' updates would only be seen by querying the
+            # database every poll_interval
+            wait = 0
+        deadline = time.time() + wait
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+
+        state = facade.get_transaction_status(txnid)
+        if state is None:
+            raise Http404
+        etag = self.get_etag(state)
+        while etag == if_none_match and time.time() < deadline:
+            time.sleep(self.poll_interval)
+            state = facade.get_transaction_status(txnid) or state
+            etag = self.get_etag(state)
+
+        if etag == if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse(state)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
 class CancelResponseView(RedirectView):
     permanent = False
 
@@ -218,3 +307,8 @@ class SuccessResponseView(PaymentDetailsView):
         self.add_payment_source(source)
         self.add_payment_event('Settled', confirm_txn.amount,
                                reference=confirm_txn.rz_id)
+
+    def handle_successful_order(self, order):
+        # The order only exists once it has been placed
+        facade.record_order(self.txn, order.number)
+        return super(SuccessResponseView, self).handle_successful_order(order)
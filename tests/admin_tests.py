@@ -0,0 +1,44 @@
+from contextlib import contextmanager
+
+import pytest
+from django.db import transaction
+
+from rzpay import admin
+from rzpay.models import RazorpayOutboxEvent, RazorpayTransaction
+
+
+def create(status):
+    return RazorpayTransaction.objects.create(
+        amount=100, currency='INR', status=status)
+
+
+@pytest.mark.django_db
+def test_chunked_update_leaves_rows_changed_meanwhile(monkeypatch):
+    abandoned = create(RazorpayTransaction.INITIATED)
+    paid = create(RazorpayTransaction.INITIATED)
+    atomic = transaction.atomic
+
+    @contextmanager
+    def checkout_first(*args, **kwargs):
+        # A checkout captures a payment after the chunk was selected
+        monkeypatch.setattr(transaction, 'atomic', atomic)
+        RazorpayTransaction.objects.filter(pk=paid.pk).update(
+            status=RazorpayTransaction.CAPTURED)
+        with atomic(*args, **kwargs):
+            yield
+
+    monkeypatch.setattr(transaction, 'atomic', checkout_first)
+    updated = admin.chunked_update(
+        RazorpayTransaction.objects.filter(
+            status=RazorpayTransaction.INITIATED),
+        on_chunk=admin.record_failed_events,
+        status=RazorpayTransaction.AUTH_FAILED)
+
+    assert updated == 1
+    paid.refresh_from_db()
+    assert paid.status == RazorpayTransaction.CAPTURED
+    abandoned.refresh_from_db()
+    assert abandoned.status == RazorpayTransaction.AUTH_FAILED
+    events = RazorpayOutboxEvent.objects.filter(
+        event_type=RazorpayOutboxEvent.FAILED)
+    assert [event.transaction_id for event in events] == [abandoned.pk]
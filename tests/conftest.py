@@ -0,0 +1,49 @@
+import django
+from django.conf import settings
+
+
+def pytest_configure():
+    if settings.configured:
+        return
+    from oscar import get_core_apps
+    from oscar.defaults import OSCAR_SETTINGS
+
+    options = dict(OSCAR_SETTINGS)
+    options.update(
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': ':memory:',
+            },
+        },
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+        },
+        INSTALLED_APPS=[
+            'django.contrib.auth',
+            'django.contrib.contenttypes',
+            'django.contrib.sessions',
+            'django.contrib.sites',
+            'django.contrib.messages',
+            'django.contrib.admin',
+            'django.contrib.flatpages',
+            'django.contrib.staticfiles',
+            'widget_tweaks',
+            'rzpay',
+        ] + get_core_apps(),
+        HAYSTACK_CONNECTIONS={
+            'default': {
+                'ENGINE': 'haystack.backends.simple_backend.SimpleEngine',
+            },
+        },
+        SITE_ID=1,
+        USE_TZ=True,
+        SECRET_KEY='tests',
+        ROOT_URLCONF='rzpay.urls',
+        RAZORPAY_API_KEY='rzp_test_key',
+        RAZORPAY_API_SECRET='secret',
+    )
+    settings.configure(**options)
+    django.setup()
@@ -0,0 +1,114 @@
+import time
+
+import pytest
+from django.core.cache import caches
+
+from rzpay import facade
+from rzpay.health import GatewayHealthMonitor
+from rzpay.scheduler import (
+    BATCH, INTERACTIVE, GatewayScheduler, RateLimitExceeded)
+
+
+class Clock(object):
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Also drives expiry in the local memory cache
+    monkeypatch.setattr(time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def monitor(clock):
+    caches['default'].clear()
+    return GatewayHealthMonitor(
+        window=60, min_calls=4, error_rate=0.5, latency=2.0, cooldown=30,
+        checkout_operations=('fetch', 'capture'))
+
+
+def test_errors_trip_the_circuit(monitor):
+    monitor.record('capture', True, 0.1)
+    monitor.record('capture', False, 0.1)
+    monitor.record('capture', True, 0.1)
+    assert not monitor.is_open('capture')
+    monitor.record('capture', False, 0.1)
+    assert monitor.is_open('capture')
+    assert not monitor.is_healthy()
+
+
+def test_circuit_closes_after_cooldown(monitor, clock):
+    for _ in range(4):
+        monitor.record('fetch', True, 2.5)
+    assert monitor.is_open('fetch')
+    clock.now += 29
+    assert monitor.is_open('fetch')
+    clock.now += 2
+    assert not monitor.is_open('fetch')
+    assert monitor.is_healthy()
+    # Calls from before the trip don't count towards the next one
+    monitor.record('fetch', True, 2.5)
+    assert monitor.stats('fetch') == (1, 0, 2500)
+    assert not monitor.is_open('fetch')
+
+
+def test_batch_calls_dont_take_razorpay_off_the_checkout(monitor):
+    for _ in range(4):
+        monitor.record('fetch', False, 10, BATCH)
+    assert monitor.is_open('fetch', BATCH)
+    assert not monitor.is_open('fetch', INTERACTIVE)
+    assert monitor.is_healthy()
+
+
+def test_batch_only_operations_dont_affect_health(monitor):
+    for _ in range(4):
+        monitor.record('create', False, 0.1)
+    assert monitor.is_open('create')
+    assert monitor.is_healthy()
+
+
+@pytest.fixture
+def gateway(monitor, clock, monkeypatch, settings):
+    settings.RAZORPAY_RATE_LIMIT_RETRIES = 0
+    scheduler = GatewayScheduler(rate=20)
+
+    def slow_acquire(priority=INTERACTIVE, timeout=None):
+        # Waiting for a token takes a while but the call itself is quick
+        clock.now += 8
+
+    monkeypatch.setattr(scheduler, 'acquire', slow_acquire)
+    monkeypatch.setattr(facade, 'scheduler', scheduler)
+    monkeypatch.setattr(facade, 'monitor', monitor)
+    return scheduler
+
+
+def fetch(*args, **kwargs):
+    return {}
+
+
+def test_token_wait_isnt_gateway_latency(gateway, monitor):
+    facade._gateway_call(INTERACTIVE, fetch, 'pay_1')
+    assert monitor.stats('fetch') == (1, 0, 0)
+
+
+def test_throttling_isnt_recorded(gateway, monitor, monkeypatch):
+    def too_many_requests(*args, **kwargs):
+        raise Exception("Too many requests")
+    too_many_requests.__name__ = 'fetch'
+    with pytest.raises(Exception):
+        facade._gateway_call(INTERACTIVE, too_many_requests, 'pay_1')
+
+    def no_token(priority=INTERACTIVE, timeout=None):
+        raise RateLimitExceeded()
+    monkeypatch.setattr(gateway, 'acquire', no_token)
+    with pytest.raises(RateLimitExceeded):
+        facade._gateway_call(INTERACTIVE, fetch, 'pay_1')
+
+    assert monitor.stats('fetch') == (0, 0, 0)
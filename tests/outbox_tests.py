@@ -0,0 +1,106 @@
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import six, timezone
+
+from rzpay.models import RazorpayOutboxEvent, RazorpayTransaction
+from rzpay.outbox import dispatch_events
+
+
+class RecordingSink(object):
+    """
+    Accepts events except those for transactions in ``reject``.
+    """
+
+    def __init__(self, reject=()):
+        self.reject = set(reject)
+        self.delivered = []
+
+    def deliver(self, events):
+        for event in events:
+            if event.transaction_id in self.reject:
+                raise IOError("Rejected %s" % event.pk)
+        self.delivered.extend(event.pk for event in events)
+
+
+def add_event():
+    txn = RazorpayTransaction.objects.create(
+        amount=100, currency='INR', status=RazorpayTransaction.INITIATED)
+    event = RazorpayOutboxEvent.for_transaction(
+        txn, RazorpayOutboxEvent.INITIATED)
+    event.save()
+    return event
+
+
+def make_due(event):
+    RazorpayOutboxEvent.objects.filter(pk=event.pk).update(
+        next_attempt=timezone.now() - timedelta(seconds=1))
+
+
+@pytest.mark.django_db
+def test_failed_events_back_off():
+    event = add_event()
+    before = timezone.now()
+
+    assert dispatch_events(sinks=[RecordingSink([event.transaction_id])]) == 0
+
+    event.refresh_from_db()
+    assert event.attempts == 1
+    assert event.date_dispatched is None
+    assert event.last_error.startswith("Rejected")
+    assert event.next_attempt >= before + timedelta(seconds=30)
+    # Not retried before it's due
+    assert dispatch_events(sinks=[RecordingSink()]) == 0
+
+    make_due(event)
+    assert dispatch_events(sinks=[RecordingSink([event.transaction_id])]) == 0
+    event.refresh_from_db()
+    assert event.attempts == 2
+    assert event.next_attempt >= before + timedelta(seconds=60)
+
+
+@pytest.mark.django_db
+def test_later_events_flow_past_a_failing_one():
+    poison, fresh = add_event(), add_event()
+    sink = RecordingSink([poison.transaction_id])
+
+    # The first batch fails as a whole
+    assert dispatch_events(sinks=[sink]) == 0
+    make_due(poison)
+    make_due(fresh)
+    later = add_event()
+
+    # Retries are then delivered one at a time, so the poison event no
+    # longer drags down the ones around it
+    assert dispatch_events(sinks=[sink]) == 2
+    assert sorted(sink.delivered) == [fresh.pk, later.pk]
+    assert RazorpayOutboxEvent.objects.filter(
+        date_dispatched__isnull=True).get() == poison
+
+
+@pytest.mark.django_db
+@override_settings(RAZORPAY_OUTBOX_MAX_ATTEMPTS=2)
+def test_events_are_abandoned_and_can_be_retried():
+    event = add_event()
+    failing = RecordingSink([event.transaction_id])
+    dispatch_events(sinks=[failing])
+    make_due(event)
+    dispatch_events(sinks=[failing])
+
+    event.refresh_from_db()
+    assert event.date_abandoned is not None
+    assert event.next_attempt is None
+    make_due(event)
+    assert dispatch_events(sinks=[RecordingSink()]) == 0
+
+    out = six.StringIO()
+    with override_settings(
+            RAZORPAY_OUTBOX_SINKS=['rzpay.outbox.SignalSink']):
+        call_command('dispatch_payment_events', retry_dead=True, stdout=out)
+    assert "Requeued 1 abandoned events" in out.getvalue()
+    assert "Dispatched 1 payment events" in out.getvalue()
+    event.refresh_from_db()
+    assert event.date_dispatched is not None
+    assert event.date_abandoned is None
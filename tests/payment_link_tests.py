@@ -0,0 +1,40 @@
+import pytest
+from django.db import router
+
+from rzpay import facade
+from rzpay.models import RazorpayTransaction
+from rzpay.scheduler import BATCH, RateLimitExceeded
+
+
+class Order(object):
+    number = '100042'
+    email = 'customer@example.com'
+
+
+def test_link_txnid_is_signed(settings):
+    txnid = facade.payment_link_txnid(Order())
+    assert len(txnid) == 28
+    assert facade.payment_link_txnid(Order()) == txnid
+    settings.SECRET_KEY = 'another secret'
+    assert facade.payment_link_txnid(Order()) != txnid
+
+
+@pytest.mark.django_db
+def test_link_waits_briefly_for_a_slot(monkeypatch):
+    txn = RazorpayTransaction.objects.create(
+        amount=100, currency='INR', email=Order.email,
+        status=RazorpayTransaction.INITIATED)
+    waits = []
+
+    def acquire(priority, timeout=None):
+        waits.append(timeout)
+        raise RateLimitExceeded()
+
+    monkeypatch.setattr(facade.scheduler, 'acquire', acquire)
+    facade._issue_payment_link(
+        txn.pk, Order(), BATCH, router.db_for_write(RazorpayTransaction))
+    assert waits == [5]
+    # Left for the next run
+    txn.refresh_from_db()
+    assert txn.invoice_id is None
+    assert txn.status == RazorpayTransaction.INITIATED
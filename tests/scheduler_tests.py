@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+from django.core.cache import caches
+
+from rzpay import scheduler as scheduler_module
+from rzpay.scheduler import (
+    BATCH, INTERACTIVE, GatewayScheduler, RateLimitExceeded)
+
+
+@pytest.fixture
+def scheduler():
+    caches['default'].clear()
+    scheduler = GatewayScheduler(rate=20, batch_share=0.5)
+    scheduler.poll_interval = 0.005
+    return scheduler
+
+
+def test_refused_polls_dont_use_up_tokens(scheduler, monkeypatch):
+    monkeypatch.setattr(scheduler_module.time, 'time', lambda: 1000.0)
+    for _ in range(10):
+        scheduler.acquire(BATCH, timeout=0)
+    for _ in range(50):
+        with pytest.raises(RateLimitExceeded):
+            scheduler.acquire(BATCH, timeout=0)
+    # The other half of the window is still there for checkouts
+    for _ in range(10):
+        scheduler.acquire(INTERACTIVE, timeout=0)
+    with pytest.raises(RateLimitExceeded):
+        scheduler.acquire(INTERACTIVE, timeout=0)
+
+
+def test_interactive_preempts_batch_under_contention(scheduler):
+    stop = threading.Event()
+
+    def batch_worker():
+        while not stop.is_set():
+            try:
+                scheduler.acquire(BATCH, timeout=0.2)
+            except RateLimitExceeded:
+                pass
+
+    workers = [threading.Thread(target=batch_worker) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    try:
+        time.sleep(0.3)
+        waits = []
+        for _ in range(5):
+            start = time.time()
+            scheduler.acquire(INTERACTIVE, timeout=2)
+            waits.append(time.time() - start)
+            time.sleep(0.05)
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+    assert max(waits) < 0.1
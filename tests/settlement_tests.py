@@ -0,0 +1,49 @@
+import pytest
+from django.core.management import call_command
+from django.utils import six
+
+from rzpay.models import RazorpaySettlement, RazorpayTransaction
+
+REPORT = (
+    "entity_id,type,debit,credit,amount,currency,fee,tax,settlement_id,"
+    "settled_at\n"
+    "pay_AAAAAAAAAAAAAA,payment,0,100,100,INR,2,0.36,setl_1,"
+    "01/02/2018 10:00:00\n"
+    "pay_BBBBBBBBBBBBBB,payment,0,200,200,INR,4,0.72,setl_1,"
+    "01/02/2018 10:00:00\n"
+)
+
+
+@pytest.fixture
+def report(tmpdir):
+    path = tmpdir.join('settlements.csv')
+    path.write(REPORT)
+    return str(path)
+
+
+def ingest(path):
+    out = six.StringIO()
+    call_command('ingest_settlements', path, stdout=out)
+    return out.getvalue()
+
+
+@pytest.mark.django_db
+def test_reingestion_matches_lines_left_unmatched(report):
+    RazorpayTransaction.objects.create(
+        amount=100, currency='INR', status='captured',
+        rz_id='pay_AAAAAAAAAAAAAA')
+    assert "Imported 2 of 2 rows" in ingest(report)
+    assert RazorpaySettlement.objects.filter(
+        transaction__isnull=True).count() == 1
+
+    # The other payment's transaction only shows up later
+    late = RazorpayTransaction.objects.create(
+        amount=200, currency='INR', status='captured',
+        rz_id='pay_BBBBBBBBBBBBBB')
+    output = ingest(report)
+
+    assert "Imported 0 of 2 rows" in output
+    assert "0 unmatched" in output
+    assert RazorpaySettlement.objects.count() == 2
+    assert RazorpaySettlement.objects.get(
+        entity_id='pay_BBBBBBBBBBBBBB').transaction == late
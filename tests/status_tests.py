@@ -0,0 +1,49 @@
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+
+from rzpay import facade
+from rzpay.models import RazorpayTransaction
+
+SHARED_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        # Stands in for memcached or Redis
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'rzpay_test_cache',
+    },
+}
+
+
+@pytest.fixture
+def txn():
+    return RazorpayTransaction.objects.create(
+        amount=100, currency='INR', status=RazorpayTransaction.INITIATED)
+
+
+def capture_elsewhere(txn):
+    # As if another worker process had captured the payment
+    RazorpayTransaction.objects.filter(pk=txn.pk).update(
+        status=RazorpayTransaction.CAPTURED)
+
+
+@pytest.mark.django_db
+def test_per_process_cache_is_bypassed(txn):
+    assert facade.get_transaction_status(txn.txnid)['status'] == 'initiated'
+    capture_elsewhere(txn)
+    assert facade.get_transaction_status(txn.txnid)['status'] == 'captured'
+
+
+@pytest.mark.django_db
+def test_shared_cache_is_used(txn):
+    with override_settings(CACHES=SHARED_CACHE, RAZORPAY_CACHE='shared'):
+        call_command('createcachetable', verbosity=0)
+        assert facade.status_cache_is_shared()
+        assert facade.get_transaction_status(
+            txn.txnid)['status'] == 'initiated'
+        capture_elsewhere(txn)
+        # Changes are published to a shared cache, so it's trusted
+        assert facade.get_transaction_status(
+            txn.txnid)['status'] == 'initiated'
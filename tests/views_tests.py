@@ -0,0 +1,30 @@
+from decimal import Decimal
+
+import pytest
+
+from rzpay import facade, views
+from rzpay.models import RazorpayTransaction
+
+
+class Order(object):
+    number = '100042'
+
+
+@pytest.mark.django_db
+def test_order_is_linked_once_placed(monkeypatch):
+    txn = RazorpayTransaction.objects.create(
+        amount=Decimal('100.00'), currency='INR', rz_id='pay_00000000000001',
+        status=RazorpayTransaction.CAPTURED)
+    monkeypatch.setattr(facade, 'capture_transaction', lambda rz_id: txn)
+    monkeypatch.setattr(
+        views.PaymentDetailsView, 'handle_successful_order',
+        lambda self, order: 'placed')
+    view = views.SuccessResponseView()
+    view.txn = txn
+
+    view.handle_payment(Order.number, None, rz_id=txn.rz_id, txn=txn)
+    # Placing the order may still fail
+    assert RazorpayTransaction.objects.get(pk=txn.pk).order_id is None
+
+    assert view.handle_successful_order(Order()) == 'placed'
+    assert RazorpayTransaction.objects.get(pk=txn.pk).order_id == '100042'